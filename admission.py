@@ -0,0 +1,107 @@
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Callable
+
+
+class QueueFullError(Exception):
+    """Raised when a request can't be admitted, retry_after is a hint in seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Limits how many queries run at once, with a bounded queue in front.
+
+    Up to max_concurrent requests run, up to max_queue more wait for a slot for
+    at most queue_timeout seconds. Anything beyond that is rejected right away
+    with QueueFullError, as is a request that waited too long, so a burst is
+    turned away quickly instead of timing out together.
+    """
+
+    def __init__(self, max_concurrent: int = 4, max_queue: int = 16, queue_timeout: float = 10.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self.active = 0
+        self.waiting = 0
+
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._avg_service = 1.0
+
+    def _retry_after(self) -> int:
+        """Rough seconds until a slot frees up, from the average time a query holds one"""
+        backlog = self.waiting + self.active
+        return max(1, math.ceil(self._avg_service * backlog / self.max_concurrent))
+
+    async def acquire(self) -> Callable[[], None]:
+        """Wait for a concurrency slot and return the function that gives it back, safe to call twice"""
+        queued_at = time.monotonic()
+        if not self._slots.locked():
+            # A slot is free, this returns without waiting
+            await self._slots.acquire()
+        else:
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise QueueFullError("Server is busy, queue is full", self._retry_after())
+
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                raise QueueFullError("Server is busy, timed out waiting in queue", self._retry_after()) from None
+            finally:
+                self.waiting -= 1
+
+        waited = time.monotonic() - queued_at
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        self.active += 1
+
+        started = time.monotonic()
+        released = False
+
+        def release():
+            nonlocal released
+            if released:
+                return
+            released = True
+            self.active -= 1
+            self._slots.release()
+            # Moving average of how long a query keeps its slot, used for Retry-After
+            self._avg_service = 0.8 * self._avg_service + 0.2 * (time.monotonic() - started)
+
+        return release
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one concurrency slot for the duration of the block"""
+        release = await self.acquire()
+        try:
+            yield
+        finally:
+            release()
+
+    def stats(self) -> dict:
+        """Current queue depth and concurrency plus admission and wait time counters"""
+        return {
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait_seconds": round(self.total_wait / self.admitted, 4) if self.admitted else 0.0,
+            "max_wait_seconds": round(self.max_wait, 4)
+        }
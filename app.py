@@ -1,14 +1,47 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse, Response, JSONResponse, PlainTextResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field
+from typing import Optional
+from contextlib import nullcontext
 import asyncio
 import sys, os, json
-from client import MCPClient
+from client import MCPClient, QueryTimeoutError
+from admission import AdmissionController, QueueFullError
+from metrics import metrics
+from tracing import tracer, current_request_id, new_request_id, KIND_SERVER
+from conversation_store import ConversationStore, Conversation
 
-asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
+if sys.platform == "win32":
+    asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
 app = FastAPI()
-client = MCPClient()
+client = MCPClient(
+    response_cache_ttl=float(os.environ["RESPONSE_CACHE_TTL"]) if os.environ.get("RESPONSE_CACHE_TTL") else None,
+    response_cache_path=os.environ.get("RESPONSE_CACHE_PATH"),
+    # Groq quotas shared by every request, unset means no local limit
+    llm_requests_per_minute=float(os.environ["LLM_REQUESTS_PER_MINUTE"]) if os.environ.get("LLM_REQUESTS_PER_MINUTE") else None,
+    llm_tokens_per_minute=float(os.environ["LLM_TOKENS_PER_MINUTE"]) if os.environ.get("LLM_TOKENS_PER_MINUTE") else None,
+    # Upper bound for the timeout a request may ask for
+    max_query_timeout=float(os.environ.get("MAX_QUERY_TIMEOUT", 600)),
+    # Lets servers marked "lazy" in mcp.json offer their tools without being spawned at startup
+    tool_snapshot_path=os.environ.get("TOOL_SNAPSHOT_PATH")
+)
+
+# Bound how many queries share the MCP sessions and the Groq key at once
+admission = AdmissionController(
+    max_concurrent=int(os.environ.get("MAX_CONCURRENT_QUERIES", 4)),
+    max_queue=int(os.environ.get("MAX_QUEUED_QUERIES", 16)),
+    queue_timeout=float(os.environ.get("QUEUE_TIMEOUT", 10))
+)
+
+# Server side history for clients that pass a conversation_id
+conversations = ConversationStore(
+    ttl=float(os.environ.get("CONVERSATION_TTL", 1800)),
+    max_conversations=int(os.environ.get("MAX_CONVERSATIONS", 1000)),
+    max_bytes=int(os.environ.get("CONVERSATION_MAX_BYTES", 50_000_000))
+)
 
 
 app.add_middleware(
@@ -21,11 +54,29 @@ app.add_middleware(
 
 class QueryRequest(BaseModel):
     query: str
+    timeout: Optional[float] = Field(default=None, gt=0)  # seconds, overrides the client's default deadline up to MAX_QUERY_TIMEOUT
+    conversation_id: Optional[str] = None  # from POST /conversations, makes this a follow up
+
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request: Request, exc: QueueFullError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 @app.on_event("startup")
 async def startup_event():
     global client
-    mcp_json = "mcp.json"
+    broker = os.environ.get("MCP_BROKER")
+    if broker:
+        # Several workers share the servers of one broker.py process instead of spawning their own
+        await client.connect_to_broker(broker, token=os.environ.get("MCP_BROKER_TOKEN"))
+        client.start_supervisor()
+        app.state.client = client
+        return
+
+    mcp_json = os.environ.get("MCP_CONFIG", "mcp.json")
 
     if not os.path.exists(mcp_json):
         print(f"Error: {mcp_json} file not found.")
@@ -40,15 +91,9 @@ async def startup_event():
         print("Error: No MCP servers found in the configuration.")
         sys.exit(1)
 
-    for server_name, server_info in servers.items():
-        command = server_info.get("command")
-        args = server_info.get("args")
-
-        if not command or not args:
-            print(f"Command: {command} or Args: {args} not found for server {server_name}.")
-            continue
-
-        await client.connect_to_server(server_name, command, args)
+    # Servers come up concurrently, a slow or broken one is just reported as unavailable
+    await client.connect_to_servers(servers)
+    client.start_supervisor()
     app.state.client = client
 
 @app.on_event("shutdown")
@@ -57,9 +102,122 @@ async def shutdown_event():
         await client.cleanup()
         print("\nMCP Client Exiting!")
 
+async def cancel_on_disconnect(request: Request, task: asyncio.Task) -> bool:
+    """Cancel the task if the HTTP client disconnects before it finishes"""
+    while not task.done():
+        if await request.is_disconnected():
+            task.cancel()
+            return True
+        await asyncio.sleep(0.5)
+    return False
+
+def start_request(request: Request) -> str:
+    """Take the caller's X-Request-ID or make one, it ends up in traces and MCP tool call metadata"""
+    request_id = request.headers.get("X-Request-ID") or new_request_id()
+    current_request_id.set(request_id)
+    return request_id
+
+def get_conversation(conversation_id: Optional[str]) -> Optional[Conversation]:
+    if conversation_id is None:
+        return None
+    conversation = conversations.get(conversation_id)
+    if conversation is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired conversation")
+    return conversation
+
+async def run_query(query: QueryRequest, conversation: Optional[Conversation]) -> str:
+    """Answer one query, one at a time per conversation so turns are recorded in order"""
+    if conversation is None:
+        return await client.process_query(query.query, timeout=query.timeout)
+    async with conversation.lock:
+        answer = await client.process_query(query.query, timeout=query.timeout, conversation=conversation)
+    conversations.touch(conversation)
+    return answer
+
 @app.post("/query")
-async def query_endpoint(query: QueryRequest):
+async def query_endpoint(query: QueryRequest, request: Request, response: Response):
     client = app.state.client
-    response = await client.process_query(query.query)
-    return {"response": response}
-
+    request_id = start_request(request)
+    response.headers["X-Request-ID"] = request_id
+    conversation = get_conversation(query.conversation_id)
+
+    with tracer.span("POST /query", kind=KIND_SERVER):
+        async with admission.slot():
+            task = asyncio.create_task(run_query(query, conversation))
+            watcher = asyncio.create_task(cancel_on_disconnect(request, task))
+            try:
+                answer = await task
+            except QueryTimeoutError as e:
+                raise HTTPException(status_code=504, detail=str(e), headers={"X-Request-ID": request_id})
+            except asyncio.CancelledError:
+                if watcher.done() and not watcher.cancelled() and watcher.result():
+                    # Nobody is left to read this, the status is just for the access log
+                    return Response(status_code=499)
+                raise
+            finally:
+                watcher.cancel()
+    if conversation is not None:
+        return {"response": answer, "conversation_id": conversation.id}
+    return {"response": answer}
+
+@app.post("/query/stream")
+async def query_stream_endpoint(query: QueryRequest, request: Request):
+    """Stream tokens, tool call events and the final answer as newline delimited JSON"""
+    client = app.state.client
+    request_id = start_request(request)
+    conversation = get_conversation(query.conversation_id)
+    # Take the slot before responding so a full queue is still a plain 503
+    release = await admission.acquire()
+
+    # Starlette cancels this generator when the client disconnects, which stops the query
+    async def event_stream():
+        current_request_id.set(request_id)
+        try:
+            with tracer.span("POST /query/stream", kind=KIND_SERVER):
+                async with conversation.lock if conversation is not None else nullcontext():
+                    async for event in client.stream_query(query.query, timeout=query.timeout, conversation=conversation):
+                        yield json.dumps(event) + "\n"
+                if conversation is not None:
+                    conversations.touch(conversation)
+        except Exception as e:
+            yield json.dumps({"type": "error", "message": str(e)}) + "\n"
+        finally:
+            release()
+
+    # The background task frees the slot even if the stream never started
+    headers = {"X-Request-ID": request_id}
+    if conversation is not None:
+        headers["X-Conversation-ID"] = conversation.id
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers=headers,
+        background=BackgroundTask(release)
+    )
+
+@app.post("/conversations")
+async def create_conversation():
+    """Start a conversation, pass the id as conversation_id to /query for follow up questions"""
+    return {"conversation_id": conversations.create().id}
+
+@app.get("/conversations")
+async def conversations_endpoint():
+    """How many conversations are held, their approximate memory and eviction counters"""
+    return conversations.stats()
+
+@app.delete("/conversations/{conversation_id}", status_code=204)
+async def delete_conversation(conversation_id: str):
+    if not conversations.delete(conversation_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired conversation")
+
+@app.get("/admission")
+async def admission_endpoint():
+    """Queue depth, concurrency and wait time counters for sizing deployments"""
+    return admission.stats()
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Per phase latency histograms and counters in the Prometheus text format"""
+    for name, value in admission.stats().items():
+        metrics.set(f"mcp_admission_{name}", value)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
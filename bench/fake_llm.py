@@ -0,0 +1,148 @@
+"""
+Scripted stand-in for the Groq chat completions API, for offline benchmarks.
+
+Each scenario in the scenarios file names a query, the rounds of tool calls the
+"model" makes for it and the final answer. The round is worked out from how
+many assistant tool call messages are already in the conversation, so the
+server is stateless and any number of queries can run at once. Tool names are
+matched against the tools offered in the request by suffix, so "add" finds
+"calculator::add" whatever the server is called in mcp.json.
+
+Run with: python bench/fake_llm.py --port 8100 --latency 0.2
+and point the client at it with GROQ_BASE_URL=http://127.0.0.1:8100
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+SCENARIOS_PATH = os.environ.get("FAKE_LLM_SCENARIOS", os.path.join(os.path.dirname(__file__), "scenarios.json"))
+# Seconds per completion, plus up to LATENCY_JITTER of random extra
+LATENCY = float(os.environ.get("FAKE_LLM_LATENCY", 0.2))
+LATENCY_JITTER = float(os.environ.get("FAKE_LLM_JITTER", 0.05))
+
+app = FastAPI()
+
+with open(SCENARIOS_PATH, "r") as f:
+    scenarios = {scenario["query"].strip().lower(): scenario for scenario in json.load(f)}
+
+stats = {"completions": 0, "tool_calls": 0, "unknown_queries": 0}
+
+
+def estimate_tokens(value) -> int:
+    return max(1, len(json.dumps(value)) // 4)
+
+
+def resolve_tool(name: str, offered: list[str]):
+    """Find the offered tool this scenario step means, or None if it wasn't offered"""
+    for tool_name in offered:
+        if tool_name == name or tool_name.endswith(f"::{name}"):
+            return tool_name
+    return None
+
+
+def next_turn(messages: list[dict], offered: list[str]) -> tuple[str | None, list[dict]]:
+    """The content and tool calls the model replies with at this point of the conversation"""
+    query = next((m.get("content") or "" for m in messages if m.get("role") == "user"), "")
+    scenario = scenarios.get(query.strip().lower())
+    if scenario is None:
+        stats["unknown_queries"] += 1
+        return f"I have no script for: {query}", []
+
+    rounds_done = sum(1 for m in messages if m.get("role") == "assistant" and m.get("tool_calls"))
+    steps = scenario.get("steps", [])
+    if rounds_done < len(steps):
+        tool_calls = []
+        for step in steps[rounds_done]:
+            tool_name = resolve_tool(step["tool"], offered)
+            if tool_name is None:
+                continue
+            tool_calls.append({
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": tool_name, "arguments": json.dumps(step.get("arguments", {}))}
+            })
+        if tool_calls:
+            return None, tool_calls
+
+    return scenario.get("answer", "Done."), []
+
+
+def stream_chunks(completion_id: str, model: str, content: str | None, tool_calls: list[dict]):
+    """Split a reply into chat.completion.chunk server sent events"""
+    def chunk(delta: dict, finish_reason=None) -> str:
+        body = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+        return f"data: {json.dumps(body)}\n\n"
+
+    yield chunk({"role": "assistant", "content": ""})
+    if content:
+        for word in content.split(" "):
+            yield chunk({"content": word + " "})
+    for index, call in enumerate(tool_calls):
+        yield chunk({"tool_calls": [{"index": index, **call}]})
+    yield chunk({}, "tool_calls" if tool_calls else "stop")
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    offered = [tool["function"]["name"] for tool in body.get("tools") or []]
+
+    await asyncio.sleep(LATENCY + random.uniform(0, LATENCY_JITTER))
+    content, tool_calls = next_turn(messages, offered)
+    stats["completions"] += 1
+    stats["tool_calls"] += len(tool_calls)
+
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    model = body.get("model", "fake")
+    if body.get("stream"):
+        return StreamingResponse(stream_chunks(completion_id, model, content, tool_calls), media_type="text/event-stream")
+
+    prompt_tokens = estimate_tokens(messages)
+    completion_tokens = estimate_tokens(tool_calls) if tool_calls else estimate_tokens(content)
+    message = {"role": "assistant", "content": content}
+    if tool_calls:
+        message["tool_calls"] = tool_calls
+    return JSONResponse({
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool_calls else "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    })
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Scripted Groq stand-in")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=LATENCY)
+    parser.add_argument("--jitter", type=float, default=LATENCY_JITTER)
+    options = parser.parse_args()
+    LATENCY, LATENCY_JITTER = options.latency, options.jitter
+    uvicorn.run(app, host="127.0.0.1", port=options.port, log_level="warning")
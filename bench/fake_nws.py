@@ -0,0 +1,125 @@
+"""
+Local stand-in for the parts of api.weather.gov that weather.py uses.
+
+Serves /points, /gridpoints/.../forecast and /alerts/active/area with canned
+GeoJSON after a configurable delay, so weather.py can be benchmarked with
+NWS_API_BASE pointing here and no network access. Like the real API responses
+carry Cache-Control and an ETag, and If-None-Match gets a 304.
+
+Run with: python bench/fake_nws.py --port 8101 --latency 0.05 --max-age 300
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+
+from fastapi import FastAPI, Request, Response
+
+LATENCY = float(os.environ.get("FAKE_NWS_LATENCY", 0.05))
+LATENCY_JITTER = float(os.environ.get("FAKE_NWS_JITTER", 0.02))
+MAX_AGE = int(os.environ.get("FAKE_NWS_MAX_AGE", 300))
+
+app = FastAPI()
+
+stats = {"points": 0, "forecasts": 0, "alerts": 0, "not_modified": 0}
+
+
+async def delay():
+    await asyncio.sleep(LATENCY + random.uniform(0, LATENCY_JITTER))
+
+
+def geojson(request: Request, body: dict) -> Response:
+    """The body with caching headers, or a bodyless 304 if the caller already has it"""
+    payload = json.dumps(body)
+    headers = {
+        "Cache-Control": f"public, max-age={MAX_AGE}",
+        "ETag": '"' + hashlib.sha1(payload.encode()).hexdigest()[:16] + '"'
+    }
+    if request.headers.get("If-None-Match") == headers["ETag"]:
+        stats["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    return Response(payload, media_type="application/geo+json", headers=headers)
+
+
+def gridpoint(lat: float, lon: float) -> tuple[str, int, int]:
+    """A made up but stable office and grid cell for a coordinate, about 2.5km per cell"""
+    office = "ABC" if lon < -100 else "XYZ"
+    return office, int(abs(lat) * 40) % 200, int(abs(lon) * 40) % 200
+
+
+@app.get("/points/{coordinates}")
+async def points(coordinates: str, request: Request):
+    await delay()
+    stats["points"] += 1
+    lat, lon = (float(part) for part in coordinates.split(","))
+    office, x, y = gridpoint(lat, lon)
+    base = str(request.base_url).rstrip("/")
+    return geojson(request, {
+        "type": "Feature",
+        "properties": {
+            "gridId": office,
+            "gridX": x,
+            "gridY": y,
+            "forecast": f"{base}/gridpoints/{office}/{x},{y}/forecast",
+            "forecastHourly": f"{base}/gridpoints/{office}/{x},{y}/forecast/hourly"
+        }
+    })
+
+
+@app.get("/gridpoints/{office}/{cell}/forecast")
+async def forecast(office: str, cell: str, request: Request):
+    await delay()
+    stats["forecasts"] += 1
+    names = ["Tonight", "Monday", "Monday Night", "Tuesday", "Tuesday Night", "Wednesday", "Wednesday Night"]
+    periods = [
+        {
+            "number": number,
+            "name": name,
+            "temperature": 60 + number,
+            "temperatureUnit": "F",
+            "windSpeed": f"{5 + number} mph",
+            "windDirection": "NW",
+            "detailedForecast": f"Mostly sunny in {office} {cell}, with a high near {60 + number}."
+        }
+        for number, name in enumerate(names, start=1)
+    ]
+    return geojson(request, {"type": "Feature", "properties": {"periods": periods}})
+
+
+@app.get("/alerts/active/area/{state}")
+async def alerts(state: str, request: Request):
+    await delay()
+    stats["alerts"] += 1
+    features = [
+        {
+            "properties": {
+                "event": event,
+                "areaDesc": f"Somewhere in {state.upper()}",
+                "severity": "Moderate",
+                "description": f"{event} in effect until further notice.",
+                "instruction": "Stay informed."
+            }
+        }
+        for event in ("Wind Advisory", "Heat Advisory")
+    ]
+    return geojson(request, {"type": "FeatureCollection", "features": features})
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local NWS API stand-in")
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--latency", type=float, default=LATENCY)
+    parser.add_argument("--jitter", type=float, default=LATENCY_JITTER)
+    parser.add_argument("--max-age", type=int, default=MAX_AGE, help="Cache-Control max-age of every response")
+    options = parser.parse_args()
+    LATENCY, LATENCY_JITTER, MAX_AGE = options.latency, options.jitter, options.max_age
+    uvicorn.run(app, host="127.0.0.1", port=options.port, log_level="warning")
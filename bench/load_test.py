@@ -0,0 +1,272 @@
+"""
+Offline end to end load test for app.py.
+
+Starts the scripted LLM (fake_llm.py) and NWS (fake_nws.py) stand-ins, runs
+app.py under uvicorn against calc.py and weather.py with a generated mcp config,
+then drives POST /query at a fixed concurrency and reports throughput, latency
+percentiles and where the time went per phase (from /metrics).
+
+    python bench/load_test.py --requests 200 --concurrency 8
+    python bench/load_test.py --url http://127.0.0.1:8000   # an app that is already running
+
+Nothing here talks to the network, so runs are comparable between changes.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Optional
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+# Histograms from metrics.py reported as phases, in the order a query goes through them
+PHASES = [
+    ("llm_queue", "mcp_llm_queue_seconds"),
+    ("llm", "mcp_llm_completion_seconds"),
+    ("tool_call", "mcp_tool_call_seconds"),
+    ("encode", "mcp_result_encode_seconds"),
+    ("query", "mcp_query_seconds"),
+]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def parse_histograms(text: str) -> dict[str, tuple[float, float]]:
+    """Sum and count of every histogram in a Prometheus text page, added up over labels"""
+    totals: dict[str, list[float]] = {}
+    for line in text.splitlines():
+        match = re.match(r"^(\w+)_(sum|count)(?:\{.*\})? ([0-9.eE+-]+)$", line)
+        if not match:
+            continue
+        name, part, value = match.groups()
+        entry = totals.setdefault(name, [0.0, 0.0])
+        entry[0 if part == "sum" else 1] += float(value)
+    return {name: (total, count) for name, (total, count) in totals.items()}
+
+
+def write_mcp_config(nws_base: str) -> str:
+    config = {
+        "mcpServers": {
+            "calculator": {"command": sys.executable, "args": [os.path.join(REPO_DIR, "calc.py")]},
+            "weather": {
+                "command": sys.executable,
+                "args": [os.path.join(REPO_DIR, "weather.py")],
+                "env": {"NWS_API_BASE": nws_base}
+            }
+        }
+    }
+    handle, path = tempfile.mkstemp(prefix="bench-mcp-", suffix=".json")
+    with os.fdopen(handle, "w") as f:
+        json.dump(config, f)
+    return path
+
+
+async def wait_until_up(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as http:
+        while time.monotonic() < deadline:
+            try:
+                await http.get(url, timeout=1.0)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+class Stack:
+    """The fake LLM, fake NWS and app.py processes for one run"""
+
+    def __init__(self, llm_latency: float, nws_latency: float, app_env: dict[str, str], verbose: bool = False):
+        self.llm_latency = llm_latency
+        self.nws_latency = nws_latency
+        self.app_env = app_env
+        self.verbose = verbose
+        self.processes: list[subprocess.Popen] = []
+        self.config_path: Optional[str] = None
+        self.url = ""
+
+    def _spawn(self, args: list[str], env: Optional[dict] = None):
+        # app.py prints every query, keep that out of the report unless asked for
+        output = None if self.verbose else subprocess.DEVNULL
+        self.processes.append(subprocess.Popen(args, cwd=REPO_DIR, env=env, stdout=output, stderr=output))
+
+    async def start(self):
+        llm_port, nws_port, app_port = free_port(), free_port(), free_port()
+        self._spawn([sys.executable, os.path.join(BENCH_DIR, "fake_llm.py"), "--port", str(llm_port), "--latency", str(self.llm_latency)])
+        self._spawn([sys.executable, os.path.join(BENCH_DIR, "fake_nws.py"), "--port", str(nws_port), "--latency", str(self.nws_latency)])
+        await wait_until_up(f"http://127.0.0.1:{llm_port}/stats")
+        await wait_until_up(f"http://127.0.0.1:{nws_port}/stats")
+
+        self.config_path = write_mcp_config(f"http://127.0.0.1:{nws_port}")
+        env = {
+            **os.environ,
+            "GROQ_BASE_URL": f"http://127.0.0.1:{llm_port}",
+            "GROQ_API_KEY": "bench",
+            "MCP_CONFIG": self.config_path,
+            **self.app_env
+        }
+        self._spawn([sys.executable, "-m", "uvicorn", "app:app", "--port", str(app_port), "--log-level", "warning"], env=env)
+        self.url = f"http://127.0.0.1:{app_port}"
+        await wait_until_up(f"{self.url}/admission")
+
+    def stop(self):
+        for process in reversed(self.processes):
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if self.config_path:
+            os.remove(self.config_path)
+
+
+async def drive(url: str, queries: list[str], total: int, concurrency: int, timeout: float) -> tuple[list[float], dict[int, int], float]:
+    """Send total queries with at most concurrency in flight, return latencies, status counts and wall time"""
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+    next_index = 0
+
+    async def worker(http: httpx.AsyncClient):
+        nonlocal next_index
+        while next_index < total:
+            query = queries[next_index % len(queries)]
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                response = await http.post(f"{url}/query", json={"query": query}, timeout=timeout)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits) as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(http) for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+    return latencies, statuses, wall
+
+
+async def scrape(url: str) -> tuple[dict, dict]:
+    async with httpx.AsyncClient() as http:
+        metrics_text = (await http.get(f"{url}/metrics")).text
+        admission = (await http.get(f"{url}/admission")).json()
+    return parse_histograms(metrics_text), admission
+
+
+def report(latencies: list[float], statuses: dict[int, int], wall: float, before: dict, after: dict, admission: dict) -> dict:
+    latencies = sorted(latencies)
+    completed = sum(statuses.values())
+    result = {
+        "requests": completed,
+        "ok": statuses.get(200, 0),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "latency_seconds": {
+            "mean": round(sum(latencies) / len(latencies), 4) if latencies else 0.0,
+            "p50": round(percentile(latencies, 0.50), 4),
+            "p95": round(percentile(latencies, 0.95), 4),
+            "p99": round(percentile(latencies, 0.99), 4),
+            "max": round(latencies[-1], 4) if latencies else 0.0
+        },
+        "admission_wait_seconds": {"avg": admission.get("avg_wait_seconds"), "max": admission.get("max_wait_seconds")},
+        "phases": {}
+    }
+
+    # Only what happened during the measured run, not warmup
+    queries = max(1, after.get("mcp_query_seconds", (0, 0))[1] - before.get("mcp_query_seconds", (0, 0))[1])
+    for phase, name in PHASES:
+        total_after, count_after = after.get(name, (0.0, 0.0))
+        total_before, count_before = before.get(name, (0.0, 0.0))
+        total, count = total_after - total_before, count_after - count_before
+        result["phases"][phase] = {
+            "calls": int(count),
+            "mean_seconds": round(total / count, 4) if count else 0.0,
+            "seconds_per_query": round(total / queries, 4)
+        }
+    return result
+
+
+def print_report(result: dict):
+    latency = result["latency_seconds"]
+    print(f"\nRequests: {result['requests']} ({result['ok']} ok)  statuses: {result['statuses']}")
+    print(f"Wall time: {result['wall_seconds']}s  throughput: {result['throughput_rps']} req/s")
+    print(f"Latency: mean {latency['mean']}s  p50 {latency['p50']}s  p95 {latency['p95']}s  p99 {latency['p99']}s  max {latency['max']}s")
+    print(f"Admission wait: avg {result['admission_wait_seconds']['avg']}s  max {result['admission_wait_seconds']['max']}s")
+    print(f"\n{'phase':<12}{'calls':>8}{'mean s':>10}{'s/query':>10}")
+    for phase, numbers in result["phases"].items():
+        print(f"{phase:<12}{numbers['calls']:>8}{numbers['mean_seconds']:>10}{numbers['seconds_per_query']:>10}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Offline load test for app.py")
+    parser.add_argument("--requests", type=int, default=100, help="measured requests")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=120.0, help="per request HTTP timeout")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per fake completion")
+    parser.add_argument("--nws-latency", type=float, default=0.05, help="seconds per fake NWS response")
+    parser.add_argument("--scenarios", default=os.path.join(BENCH_DIR, "scenarios.json"))
+    parser.add_argument("--url", help="benchmark an app that is already running instead of starting one")
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for app.py, e.g. MAX_CONCURRENT_QUERIES=8")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the output of the started processes")
+    options = parser.parse_args()
+
+    with open(options.scenarios, "r") as f:
+        queries = [scenario["query"] for scenario in json.load(f)]
+
+    stack = None
+    url = options.url
+    if url is None:
+        app_env = dict(item.split("=", 1) for item in options.app_env)
+        stack = Stack(options.llm_latency, options.nws_latency, app_env, options.verbose)
+        print("Starting fake LLM, fake NWS and app.py...")
+        await stack.start()
+        url = stack.url
+
+    try:
+        if options.warmup:
+            await drive(url, queries, options.warmup, min(options.concurrency, options.warmup), options.timeout)
+        before, _ = await scrape(url)
+        print(f"Running {options.requests} requests at concurrency {options.concurrency} against {url}")
+        latencies, statuses, wall = await drive(url, queries, options.requests, options.concurrency, options.timeout)
+        after, admission = await scrape(url)
+    finally:
+        if stack is not None:
+            stack.stop()
+
+    result = report(latencies, statuses, wall, before, after, admission)
+    print_report(result)
+    if options.json:
+        with open(options.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
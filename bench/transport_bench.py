@@ -0,0 +1,86 @@
+"""
+Per tool call latency of calc.py over stdio versus in-process.
+
+Connects MCPClient to the same server twice, once spawned as a subprocess and
+once imported with "type": "inprocess", then times sequential and concurrent
+add() calls on each.
+
+    python bench/transport_bench.py --calls 2000 --concurrency 16
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from client import MCPClient  # noqa: E402
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def time_calls(session, calls: int, concurrency: int) -> tuple[list[float], float]:
+    """Latency of each call and the wall time for all of them"""
+    latencies: list[float] = []
+    next_call = 0
+
+    async def worker():
+        nonlocal next_call
+        while next_call < calls:
+            next_call += 1
+            started = time.perf_counter()
+            await session.call_tool("add", {"a": next_call, "b": 1})
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - started
+
+
+def summary(latencies: list[float], wall: float) -> str:
+    latencies = sorted(latencies)
+    micros = [value * 1e6 for value in (
+        sum(latencies) / len(latencies),
+        percentile(latencies, 0.50),
+        percentile(latencies, 0.99)
+    )]
+    return f"mean {micros[0]:8.0f}us  p50 {micros[1]:8.0f}us  p99 {micros[2]:8.0f}us  {len(latencies) / wall:8.0f} calls/s"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="stdio vs in-process tool call latency")
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    options = parser.parse_args()
+
+    calc_path = os.path.join(REPO_DIR, "calc.py")
+    client = MCPClient()
+    # The in-process server logs every request into this process, which would dominate the timings
+    logging.getLogger("mcp.server").setLevel(logging.WARNING)
+    try:
+        await client.connect_to_servers({
+            "stdio": {"command": sys.executable, "args": [calc_path]},
+            "inprocess": {"type": "inprocess", "path": calc_path}
+        })
+        for name in ("stdio", "inprocess"):
+            connection = client.connections[name]
+            session = connection.session
+            await time_calls(session, 50, 1)  # warm up
+            sequential = await time_calls(session, options.calls, 1)
+            concurrent = await time_calls(session, options.calls, options.concurrency)
+            print(f"\n{name} (connect {connection.startup_time * 1000:.0f}ms)")
+            print(f"  sequential      {summary(*sequential)}")
+            print(f"  concurrency {options.concurrency:<3} {summary(*concurrent)}")
+    finally:
+        await client.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,280 @@
+"""
+Shared MCP server broker for running app.py with several workers.
+
+Owns one set of MCP server sessions (spawned from mcp.json and kept healthy by
+the supervisor) and serves tool calls from any number of workers over a local
+socket, so the server fleet does not grow with the worker count.
+
+    MCP_BROKER_TOKEN=secret python broker.py mcp.json --port 8765
+    MCP_BROKER_TOKEN=secret MCP_BROKER=127.0.0.1:8765 uvicorn app:app --workers 4
+
+Anyone who can connect can run every configured tool, so with MCP_BROKER_TOKEN
+set a worker must present it first, and the broker refuses to listen beyond
+loopback without one.
+
+Protocol: newline delimited JSON. The first message of a connection is
+{"method": "auth", "params": {"token"}}, answered with {"result": "ok"} or an
+{"error"} before the broker hangs up. Requests are {"id", "method", "params"} and
+answered with {"id", "result"} or {"id", "error"}. Methods are servers,
+list_tools, call_tool, ping and cancel. The broker sends {"method":
+"tools_changed", "params": {"server"}} to every worker when a server's tool
+list may have changed.
+"""
+import argparse
+import asyncio
+import hmac
+import ipaddress
+import json
+import os
+import sys
+from contextlib import nullcontext
+from datetime import timedelta
+from typing import Any, Callable, Optional
+
+import mcp.types as types
+from mcp import ClientSession
+
+from broker_link import MAX_LINE_BYTES, DEFAULT_BROKER_PORT, AUTH_TIMEOUT
+from client import MCPClient
+from server_connection import LazyServerConnection
+
+if sys.platform == "win32":
+    asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class BrokerClient(MCPClient):
+    """MCPClient that reports tool list changes and server restarts to the broker"""
+
+    def __init__(self, on_tools_changed: Callable[[str], None], **options):
+        super().__init__(**options)
+        self.on_tools_changed = on_tools_changed
+
+    def _make_message_handler(self, server_name: str):
+        handle = super()._make_message_handler(server_name)
+
+        async def handle_message(message) -> None:
+            await handle(message)
+            if isinstance(message, types.ServerNotification) and isinstance(message.root, types.ToolListChangedNotification):
+                self.on_tools_changed(server_name)
+        return handle_message
+
+    async def _on_server_restarted(self, server_name: str, session: ClientSession):
+        await super()._on_server_restarted(server_name, session)
+        self.on_tools_changed(server_name)
+
+
+class MCPBroker:
+    """Serves the sessions of a BrokerClient to worker processes over TCP"""
+
+    def __init__(self, servers_config: dict, token: Optional[str] = None, **client_options):
+        self.servers_config = servers_config
+        self.token = token
+        self.client = BrokerClient(self._broadcast_tools_changed, **client_options)
+        self.server: asyncio.AbstractServer | None = None
+        self._workers: set[asyncio.StreamWriter] = set()
+        self.stats = {"workers": 0, "requests": 0, "tool_calls": 0, "errors": 0, "cancelled": 0, "rejected": 0}
+
+    async def start(self, host: str, port: int):
+        if not is_loopback(host) and not self.token:
+            raise ValueError(f"Refusing to listen on {host} without MCP_BROKER_TOKEN, any client could run the tools")
+        if not self.token:
+            print("MCP_BROKER_TOKEN is not set, any local user can use the broker")
+        await self.client.connect_to_servers(self.servers_config)
+        self.client.start_supervisor()
+        self.server = await asyncio.start_server(self._serve_worker, host, port, limit=MAX_LINE_BYTES)
+        print(f"MCP broker listening on {host}:{port}")
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        await self.client.cleanup()
+
+    async def _authenticate(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        """Read the auth message a connection starts with and answer it"""
+        try:
+            message = json.loads(await asyncio.wait_for(reader.readline(), AUTH_TIMEOUT))
+            token = (message.get("params") or {}).get("token") if message.get("method") == "auth" else None
+        except (asyncio.TimeoutError, OSError, ValueError, AttributeError):
+            token = None
+            message = None
+        accepted = message is not None and (not self.token or self._token_matches(token))
+        reply = {"result": "ok"} if accepted else {"error": "Unauthorized"}
+        try:
+            writer.write(json.dumps(reply).encode() + b"\n")
+            await writer.drain()
+        except OSError:
+            return False
+        return accepted
+
+    def _token_matches(self, token: Any) -> bool:
+        # compare_digest only takes ASCII str, bytes work for any token
+        try:
+            return hmac.compare_digest(str(token or "").encode(), self.token.encode()) #type: ignore
+        except UnicodeEncodeError:
+            return False
+
+    async def _serve_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Handle one worker connection, each request runs in its own task so calls overlap"""
+        accepted = False
+        try:
+            accepted = await self._authenticate(reader, writer)
+        finally:
+            # Whatever went wrong, a connection that is not served is not left open
+            if not accepted:
+                writer.close()
+        if not accepted:
+            self.stats["rejected"] += 1
+            print("Rejected a worker connection that did not authenticate")
+            return
+        self._workers.add(writer)
+        self.stats["workers"] += 1
+        write_lock = asyncio.Lock()
+        tasks: dict[int, asyncio.Task] = {}
+
+        async def reply(message: dict):
+            async with write_lock:
+                writer.write(json.dumps(message).encode() + b"\n")
+                await writer.drain()
+
+        async def run(request_id: int, method: str, params: dict):
+            try:
+                result = await self._dispatch(method, params)
+                await reply({"id": request_id, "result": result})
+            except asyncio.CancelledError:
+                self.stats["cancelled"] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                try:
+                    await reply({"id": request_id, "error": str(e) or type(e).__name__})
+                except OSError:
+                    pass
+            finally:
+                tasks.pop(request_id, None)
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                method = message.get("method")
+                params = message.get("params") or {}
+                if method == "cancel":
+                    task = tasks.get(params.get("id"))
+                    if task is not None:
+                        task.cancel()
+                    continue
+                self.stats["requests"] += 1
+                tasks[message["id"]] = asyncio.create_task(run(message["id"], method, params))
+        except (OSError, ValueError) as e:
+            print(f"Worker connection failed: {str(e) or type(e).__name__}")
+        finally:
+            # The worker is gone, nobody is waiting for its calls
+            for task in list(tasks.values()):
+                task.cancel()
+            self._workers.discard(writer)
+            writer.close()
+
+    async def _dispatch(self, method: str, params: dict) -> Any:
+        if method == "servers":
+            # Workers mirror the cache settings so they behave as if they owned the servers
+            return {
+                name: {key: value for key, value in self.servers_config.get(name, {}).items() if key in ("cacheTools", "uncacheableTools", "startupTimeout")}
+                for name in self.client.connections
+            }
+
+        server_name = params.get("server")
+        connection = self.client.connections.get(server_name) #type: ignore
+        if connection is None:
+            raise ValueError(f"Unknown server {server_name}")
+
+        if method == "list_tools":
+            await self.client.get_tool_catalog()
+            tools = self.client.server_tools.get(server_name, []) #type: ignore
+            return types.ListToolsResult(tools=tools).model_dump(mode="json", by_alias=True, exclude_none=True)
+
+        lazy = isinstance(connection, LazyServerConnection)
+        if not lazy and (connection.status != "ready" or connection.session is None):
+            raise RuntimeError(f"Server {server_name} is unavailable ({connection.status})")
+
+        if method == "ping":
+            if lazy and connection.session is None:
+                # An idle lazy server counts as up, it is spawned by the next call
+                return {}
+            await connection.session.send_ping() #type: ignore
+            return {}
+
+        if method == "call_tool":
+            self.stats["tool_calls"] += 1
+            timeout = params.get("timeout")
+            async with (connection.use() if lazy else nullcontext(connection.session)) as session: #type: ignore
+                # Bounds calls across all workers, each worker also has its own limit
+                async with self.client.server_semaphores[server_name]: #type: ignore
+                    result = await session.call_tool(
+                        params["tool"],
+                        params.get("arguments") or {},
+                        read_timeout_seconds=timedelta(seconds=timeout) if timeout else None,
+                        meta=params.get("meta")
+                    )
+            return result.model_dump(mode="json", by_alias=True, exclude_none=True)
+
+        raise ValueError(f"Unknown method {method}")
+
+    def _broadcast_tools_changed(self, server_name: str):
+        """Tell every worker to re-list the server's tools"""
+        line = json.dumps({"method": "tools_changed", "params": {"server": server_name}}).encode() + b"\n"
+        for writer in list(self._workers):
+            try:
+                writer.write(line)
+            except OSError:
+                self._workers.discard(writer)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Shared MCP server broker")
+    parser.add_argument("config", nargs="?", default=os.environ.get("MCP_CONFIG", "mcp.json"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_BROKER_PORT)
+    options = parser.parse_args()
+
+    if not os.path.exists(options.config):
+        print(f"File {options.config} does not exist.")
+        sys.exit(1)
+    with open(options.config, "r") as f:
+        servers = json.load(f).get("mcpServers", {})
+    if not servers:
+        print("No MCP servers found in the configuration.")
+        sys.exit(1)
+
+    broker = MCPBroker(
+        servers,
+        token=os.environ.get("MCP_BROKER_TOKEN"),
+        tool_snapshot_path=os.environ.get("TOOL_SNAPSHOT_PATH")
+    )
+    try:
+        await broker.start(options.host, options.port)
+    except ValueError as e:
+        print(str(e))
+        sys.exit(1)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await broker.stop()
+        print("\nMCP broker exiting")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
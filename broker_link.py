@@ -0,0 +1,202 @@
+import asyncio
+import itertools
+import json
+from datetime import timedelta
+from typing import Any, Optional
+
+import mcp.types as types
+
+# Tool results can be large, one message is one line
+MAX_LINE_BYTES = 64 * 1024 * 1024
+DEFAULT_BROKER_PORT = 8765
+# Seconds either side waits for the auth exchange of a new connection
+AUTH_TIMEOUT = 10.0
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    """host:port, a bare port or a bare host, localhost and DEFAULT_BROKER_PORT fill the gaps"""
+    host, _, port = address.rpartition(":")
+    if not host:
+        if port.isdigit():
+            return "127.0.0.1", int(port)
+        return port or "127.0.0.1", DEFAULT_BROKER_PORT
+    return host, int(port) if port else DEFAULT_BROKER_PORT
+
+
+class BrokerError(Exception):
+    """The broker could not be reached or reported a failure for a request"""
+
+
+class BrokerLink:
+    """
+    One socket from a worker to the MCP broker, shared by every server it proxies.
+
+    Requests are newline delimited JSON tagged with an id, so any number of tool
+    calls can be in flight at once and answers come back in whatever order they
+    finish. A call cancelled here (deadline, client gone) is cancelled on the
+    broker too. tools_changed notifications from the broker are handed to the
+    message handler registered for that server. If the socket drops, pending
+    requests fail and the next request reconnects. Every connection starts by
+    presenting the broker's shared token.
+    """
+
+    def __init__(self, host: str, port: int, token: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.token = token
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        self._pending: dict[int, asyncio.Future] = {}
+        self._handlers: dict[str, Any] = {}
+        self._ids = itertools.count(1)
+        self._connect_lock = asyncio.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self):
+        """Open the socket unless it is already open"""
+        async with self._connect_lock:
+            if self.connected:
+                return
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port, limit=MAX_LINE_BYTES),
+                    AUTH_TIMEOUT
+                )
+            except (OSError, asyncio.TimeoutError) as e:
+                raise BrokerError(f"Cannot reach MCP broker at {self.host}:{self.port}: {str(e) or type(e).__name__}") from e
+            try:
+                writer.write(json.dumps({"method": "auth", "params": {"token": self.token}}).encode() + b"\n")
+                # Something that accepts but never answers is not a broker
+                await asyncio.wait_for(writer.drain(), AUTH_TIMEOUT)
+                answer = json.loads(await asyncio.wait_for(reader.readline(), AUTH_TIMEOUT) or b"{}")
+            except asyncio.TimeoutError as e:
+                writer.close()
+                raise BrokerError(f"No answer from MCP broker at {self.host}:{self.port} within {AUTH_TIMEOUT:g}s") from e
+            except (OSError, ValueError) as e:
+                writer.close()
+                raise BrokerError(f"MCP broker at {self.host}:{self.port} closed the connection: {str(e)}") from e
+            if answer.get("result") != "ok":
+                writer.close()
+                raise BrokerError(f"MCP broker at {self.host}:{self.port} refused the connection: {answer.get('error', 'no answer')}")
+            self._reader, self._writer = reader, writer
+            self._read_task = asyncio.create_task(self._read_loop(self._reader), name="mcp-broker-link")
+
+    def subscribe(self, server_name: str, message_handler):
+        """Route the broker's notifications about server_name to an MCP message handler"""
+        if message_handler is not None:
+            self._handlers[server_name] = message_handler
+
+    async def _send(self, message: dict):
+        if not self.connected:
+            raise BrokerError("Not connected to the MCP broker")
+        self._writer.write(json.dumps(message).encode() + b"\n") #type: ignore
+        await self._writer.drain() #type: ignore
+
+    async def request(self, method: str, **params) -> Any:
+        """Send a request and wait for its result"""
+        await self.connect()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await self._send({"id": request_id, "method": method, "params": params})
+            return await future
+        except asyncio.CancelledError:
+            if not future.done() and self.connected:
+                # Nobody waits for the answer any more, stop the work on the broker side
+                try:
+                    await self._send({"method": "cancel", "params": {"id": request_id}})
+                except (BrokerError, OSError):
+                    pass
+            raise
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def _read_loop(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if "id" in message:
+                    future = self._pending.get(message["id"])
+                    if future is None or future.done():
+                        continue
+                    if "error" in message:
+                        future.set_exception(BrokerError(message["error"]))
+                    else:
+                        future.set_result(message.get("result"))
+                elif message.get("method") == "tools_changed":
+                    await self._notify_tools_changed(message["params"]["server"])
+        except (OSError, ValueError) as e:
+            print(f"MCP broker connection failed: {str(e) or type(e).__name__}")
+        finally:
+            self._disconnect()
+
+    async def _notify_tools_changed(self, server_name: str):
+        handler = self._handlers.get(server_name)
+        if handler is not None:
+            await handler(types.ServerNotification(
+                types.ToolListChangedNotification(method="notifications/tools/list_changed")
+            ))
+
+    def _disconnect(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._writer = None
+        self._reader = None
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(BrokerError("Lost connection to the MCP broker"))
+
+    async def close(self):
+        if self._read_task is not None:
+            self._read_task.cancel()
+            try:
+                await self._read_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._read_task = None
+        self._disconnect()
+
+
+class RemoteSession:
+    """
+    Stands in for the ClientSession of a server owned by the broker.
+
+    Has the ClientSession calls the client uses (list_tools, call_tool,
+    send_ping) and forwards them over the broker link.
+    """
+
+    def __init__(self, link: BrokerLink, server_name: str):
+        self.link = link
+        self.server_name = server_name
+
+    async def list_tools(self) -> types.ListToolsResult:
+        result = await self.link.request("list_tools", server=self.server_name)
+        return types.ListToolsResult.model_validate(result)
+
+    async def call_tool(
+        self,
+        name: str,
+        arguments: Optional[dict[str, Any]] = None,
+        read_timeout_seconds: Optional[timedelta] = None,
+        meta: Optional[dict[str, Any]] = None
+    ) -> types.CallToolResult:
+        result = await self.link.request(
+            "call_tool",
+            server=self.server_name,
+            tool=name,
+            arguments=arguments or {},
+            timeout=read_timeout_seconds.total_seconds() if read_timeout_seconds else None,
+            meta=meta
+        )
+        return types.CallToolResult.model_validate(result)
+
+    async def send_ping(self):
+        await self.link.request("ping", server=self.server_name)
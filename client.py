@@ -1,52 +1,456 @@
 import asyncio
-from typing import Optional
-from contextlib import AsyncExitStack
+import time
+from typing import Any, Optional
+from contextlib import aclosing, nullcontext
+
+from datetime import timedelta
 
 from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+import mcp.types as types
 
-from groq import AsyncGroq
+from groq import AsyncGroq, APITimeoutError
+from groq.types.chat import ChatCompletionMessageToolCall
+from groq.types.chat.chat_completion_message_tool_call import Function
 from dotenv import load_dotenv
 import os
 import sys
 import json
+import hashlib
+
+from server_connection import ServerConnection, LazyServerConnection, InProcessServerConnection, BrokerServerConnection, load_server_object
+from broker_link import BrokerLink, BrokerError, parse_address
+from tool_snapshot import ToolSnapshot, server_key
+from supervisor import ServerSupervisor
+from context_window import ContextWindow, CHARS_PER_TOKEN
+from tool_cache import ToolResultCache
+from tool_index import ToolIndex
+from result_encoder import encode_result, legacy_encoding
+from response_cache import ResponseCache
+from conversation_store import Conversation
+from metrics import metrics
+from llm_gateway import LLMGateway
+from tracing import tracer, current_request_id, new_request_id, KIND_CLIENT
 
 load_dotenv()  # load environment variables from .env
 
+DEFAULT_STARTUP_TIMEOUT = 30.0
+
+
+class QueryTimeoutError(Exception):
+    """Raised when a query runs past its deadline"""
+
+
+def time_left(deadline: float) -> float:
+    """Seconds until the deadline, raising QueryTimeoutError once it has passed"""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise QueryTimeoutError("Query deadline exceeded")
+    return remaining
+
 
 class MCPClient:
-    def __init__(self):
+    def __init__(
+        self,
+        catalog_ttl: Optional[float] = None,
+        max_concurrent_calls: int = 4,
+        context_budget: int = 6000,
+        context_policy: str = "truncate",
+        summary_model: str = "llama-3.1-8b-instant",
+        tool_cache_max_bytes: int = 10_000_000,
+        tool_top_k: Optional[int] = 10,
+        tool_result_max_chars: int = 4000,
+        query_timeout: float = 120.0,
+        max_query_timeout: float = 600.0,
+        max_iterations: int = 10,
+        response_cache_ttl: Optional[float] = None,
+        response_cache_size: int = 1000,
+        response_cache_path: Optional[str] = None,
+        llm_requests_per_minute: Optional[float] = None,
+        llm_tokens_per_minute: Optional[float] = None,
+        lazy: bool = False,
+        idle_timeout: Optional[float] = 300.0,
+        tool_snapshot_path: Optional[str] = None,
+        tool_snapshot_max_age: float = 86400.0,
+        history_turns: int = 5,
+        history_tokens: int = 2000
+    ):
         # Initialize session and client objects
         self.sessions: list[tuple[str, ClientSession]] = []
-        self.exit_stack = AsyncExitStack()
-        self.groq = AsyncGroq(api_key=os.environ.get("GROQ_API_KEY"))
+        self.connections: dict[str, ServerConnection] = {}
+        self.startup_report: list[dict] = []
+        self.supervisor: Optional[ServerSupervisor] = None
+        # Retries are left to the gateway, which every Groq call goes through
+        self.groq = AsyncGroq(api_key=os.environ.get("GROQ_API_KEY"), max_retries=0)
+        self.llm = LLMGateway(self.groq, requests_per_minute=llm_requests_per_minute, tokens_per_minute=llm_tokens_per_minute)
+
+        # Tool catalog cache, filled at connect time and only refreshed when a
+        # server sends tools/list_changed, the TTL runs out or refresh_tools() is called
+        self.catalog_ttl = catalog_ttl
+        self.server_tools: dict[str, list[types.Tool]] = {}
+        self.available_tools: list[dict] = []
+        self.tool_session_map: dict[str, Optional[ClientSession]] = {}
+        self._stale_servers: set[str] = set()
+        self._catalog_loaded_at: dict[str, float] = {}
+
+        # Only the tool_top_k tools most relevant to the query are sent to Groq, None sends all of them
+        self.tool_top_k = tool_top_k
+        self.tool_index = ToolIndex([])
+        self.tool_selection_stats = {"requests": 0, "fallbacks": 0, "tools_offered": 0, "tools_total": 0, "schema_tokens_saved": 0}
+
+        # Cap on in-flight tool calls per server so one stdio server isn't flooded
+        self.max_concurrent_calls = max_concurrent_calls
+        self.server_semaphores: dict[str, asyncio.Semaphore] = {}
+
+        # Per request token budget for the message history sent to Groq
+        self.context_budget = context_budget
+        self.context_policy = context_policy
+        self.summary_model = summary_model
+        self.context_stats = {"requests": 0, "compacted": 0, "tokens_saved": 0}
+
+        # Tool results are sent to Groq as compact text capped at tool_result_max_chars
+        self.tool_result_max_chars = tool_result_max_chars
+        self.encoding_stats = {"requests": 0, "bytes_saved": 0}
+
+        # Default deadline for a whole query and cap on LLM rounds per query
+        self.query_timeout = query_timeout
+        # A caller's timeout is capped here, it can shorten the deadline but never lift it
+        self.max_query_timeout = max_query_timeout
+        self.max_iterations = max_iterations
+
+        # Optional cache of final answers, enabled by giving it a TTL
+        self.response_cache: Optional[ResponseCache] = None
+        if response_cache_ttl is not None:
+            self.response_cache = ResponseCache(ttl=response_cache_ttl, max_entries=response_cache_size, path=response_cache_path)
+        self.uncacheable_tools: set[str] = set()
+        self.catalog_fingerprint = ""
+
+        # Results of tools marked cacheable in mcp.json are served locally
+        self.tool_cache = ToolResultCache(max_bytes=tool_cache_max_bytes)
+
+        # Lazy servers are only spawned for their first tool call and shut down after idle_timeout,
+        # their tools come from the snapshot file until then
+        self.lazy = lazy
+        self.idle_timeout = idle_timeout
+        self.tool_snapshot = ToolSnapshot(tool_snapshot_path) if tool_snapshot_path else None
+        self.tool_snapshot_max_age = tool_snapshot_max_age
+        self._background_tasks: set[asyncio.Task] = set()
+
+        # How much of a conversation's earlier turns is sent along with a follow up query
+        self.history_turns = history_turns
+        self.history_tokens = history_tokens
+
+        # Set by connect_to_broker when the servers are owned by a shared broker process
+        self.broker_link: Optional[BrokerLink] = None
+
+    async def connect_to_server(
+        self,
+        server_name: str,
+        command:str,
+        args: list[str],
+        timeout: Optional[float] = None,
+        cache_tools: Optional[dict[str, Optional[float]]] = None,
+        uncacheable_tools: Optional[list[str]] = None,
+        env: Optional[dict[str, str]] = None,
+        lazy: Optional[bool] = None,
+        idle_timeout: Optional[float] = None
+    ):
+        """
+        Connect to an MCP server using command and args, env is added to the default server environment.
 
-    async def connect_to_server(self, server_name: str, command:str, args: list[str]):
-        """Connect to an MCP server using command and args"""
+        A lazy server is not spawned if its tools are in the snapshot, otherwise it
+        is started once to list them and left to shut down when idle.
+        """
+        self._configure_caching(server_name, cache_tools, uncacheable_tools)
 
         server_params = StdioServerParameters(
             command=command,
             args=args,
-            env=None
+            env=env
         )
-        
-        stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
-        stdio, write = stdio_transport
-        session = await self.exit_stack.enter_async_context(ClientSession(stdio, write))
-        await session.initialize()
-        self.sessions.append((server_name, session))
-        
 
-    async def process_query(self, query: str) -> str:
-        """Process a query using Groq and available tools"""
-        # Get available tools from the server
-        print(f"Processing query: {query}")
+        if lazy if lazy is not None else self.lazy:
+            connection = LazyServerConnection(
+                server_name,
+                server_params,
+                message_handler=self._make_message_handler(server_name),
+                idle_timeout=idle_timeout if idle_timeout is not None else self.idle_timeout,
+                startup_timeout=timeout,
+                on_spawn=lambda session: self._on_lazy_server_spawned(server_name)
+            )
+            self.connections[server_name] = connection
+            self.server_semaphores[server_name] = asyncio.Semaphore(self.max_concurrent_calls)
+            if not self._load_tool_snapshot(server_name, server_params):
+                # No snapshot, spawn it once for its tools, listing them counts against the startup timeout
+                started = time.perf_counter()
+                try:
+                    async with asyncio.timeout(timeout):
+                        async with connection.use() as session:
+                            await self._load_server_tools(server_name, session)
+                except TimeoutError:
+                    connection.error = f"timed out after {timeout}s"
+                    raise
+                finally:
+                    connection.startup_time = time.perf_counter() - started
+            return
+
+        connection = ServerConnection(server_name, server_params, message_handler=self._make_message_handler(server_name))
+        await self._start_connection(server_name, connection, timeout)
+
+    async def connect_to_inprocess_server(
+        self,
+        server_name: str,
+        module: Optional[str] = None,
+        path: Optional[str] = None,
+        attribute: str = "mcp",
+        timeout: Optional[float] = None,
+        cache_tools: Optional[dict[str, Optional[float]]] = None,
+        uncacheable_tools: Optional[list[str]] = None
+    ):
+        """Import a Python FastMCP server (by module name or file path) and connect to it in this process"""
+        self._configure_caching(server_name, cache_tools, uncacheable_tools)
+        server = load_server_object(module=module, path=path, attribute=attribute)
+        connection = InProcessServerConnection(server_name, server, message_handler=self._make_message_handler(server_name))
+        await self._start_connection(server_name, connection, timeout)
+
+    async def connect_to_broker(
+        self,
+        address: str,
+        startup_timeout: float = DEFAULT_STARTUP_TIMEOUT,
+        token: Optional[str] = None
+    ) -> list[dict]:
+        """
+        Use the servers of a running MCP broker (broker.py) instead of spawning our own.
+
+        Every server the broker has up is proxied over one local socket, with the
+        broker's cache settings for it, so any number of workers share a single
+        set of server processes.
+        """
+        host, port = parse_address(address)
+        self.broker_link = BrokerLink(host, port, token)
+        try:
+            servers = await asyncio.wait_for(self.broker_link.request("servers"), startup_timeout)
+        except asyncio.TimeoutError:
+            raise BrokerError(f"MCP broker at {address} did not list its servers within {startup_timeout}s") from None
+        return await self.connect_to_servers(
+            {name: {**info, "type": "broker"} for name, info in servers.items()},
+            startup_timeout
+        )
+
+    async def connect_to_broker_server(
+        self,
+        server_name: str,
+        timeout: Optional[float] = None,
+        cache_tools: Optional[dict[str, Optional[float]]] = None,
+        uncacheable_tools: Optional[list[str]] = None
+    ):
+        """Connect to one server through the broker link opened by connect_to_broker"""
+        if self.broker_link is None:
+            raise RuntimeError("Call connect_to_broker first")
+        self._configure_caching(server_name, cache_tools, uncacheable_tools)
+        connection = BrokerServerConnection(server_name, self.broker_link, message_handler=self._make_message_handler(server_name))
+        await self._start_connection(server_name, connection, timeout)
+
+    def _configure_caching(self, server_name: str, cache_tools: Optional[dict[str, Optional[float]]], uncacheable_tools: Optional[list[str]]):
+        if cache_tools:
+            self.tool_cache.configure(server_name, cache_tools)
+        # Answers that used these tools (e.g. roll_dice) are never put in the response cache
+        for tool_name in uncacheable_tools or []:
+            self.uncacheable_tools.add(f"{server_name}::{tool_name}")
+
+    async def _start_connection(self, server_name: str, connection: ServerConnection, timeout: Optional[float]):
+        """Start a server, then register its session and tools, all within timeout seconds"""
+        self.connections[server_name] = connection
+        started = time.perf_counter()
+        try:
+            # A server that initializes but hangs on tools/list must not hold up startup either
+            async with asyncio.timeout(timeout):
+                session = await connection.start(timeout)
+                self.sessions.append((server_name, session))
+                self.server_semaphores[server_name] = asyncio.Semaphore(self.max_concurrent_calls)
+                await self._load_server_tools(server_name, session)
+        except TimeoutError:
+            connection.status = "unavailable"
+            connection.error = f"timed out after {timeout}s"
+            raise
+        finally:
+            connection.startup_time = time.perf_counter() - started
+            metrics.observe("mcp_connect_seconds", connection.startup_time, server=server_name, status=connection.status)
+
+    async def connect_to_servers(self, servers: dict, startup_timeout: float = DEFAULT_STARTUP_TIMEOUT) -> list[dict]:
+        """
+        Connect to every server from the mcpServers config concurrently.
+
+        A server that fails or does not finish initializing within its timeout
+        (startupTimeout in its config, else startup_timeout) is reported as
+        unavailable and does not stop the others from coming up.
+        """
+        names = []
+        attempts = []
+        report = []
+
+        for server_name, server_info in servers.items():
+            timeout = server_info.get("startupTimeout", startup_timeout)
+            if server_info.get("type") == "broker":
+                names.append(server_name)
+                attempts.append(self.connect_to_broker_server(
+                    server_name,
+                    timeout=timeout,
+                    cache_tools=server_info.get("cacheTools"),
+                    uncacheable_tools=server_info.get("uncacheableTools")
+                ))
+                continue
+            if server_info.get("type") == "inprocess":
+                # A Python FastMCP server imported into this process instead of spawned
+                if not server_info.get("module") and not server_info.get("path"):
+                    print(f"Module or path not found for in-process server {server_name}.")
+                    report.append({"server": server_name, "status": "skipped", "seconds": 0.0, "error": "missing module or path"})
+                    continue
+                names.append(server_name)
+                attempts.append(self.connect_to_inprocess_server(
+                    server_name,
+                    module=server_info.get("module"),
+                    path=server_info.get("path"),
+                    attribute=server_info.get("attribute", "mcp"),
+                    timeout=timeout,
+                    cache_tools=server_info.get("cacheTools"),
+                    uncacheable_tools=server_info.get("uncacheableTools")
+                ))
+                continue
+
+            command = server_info.get("command")
+            args = server_info.get("args", [])
+            if not command or not args:
+                print(f"Command: {command} or Args: {args} not found for server {server_name}.")
+                report.append({"server": server_name, "status": "skipped", "seconds": 0.0, "error": "missing command or args"})
+                continue
+            names.append(server_name)
+            attempts.append(self.connect_to_server(
+                server_name,
+                command,
+                args,
+                timeout=timeout,
+                cache_tools=server_info.get("cacheTools"),
+                uncacheable_tools=server_info.get("uncacheableTools"),
+                env=server_info.get("env"),
+                lazy=server_info.get("lazy"),
+                idle_timeout=server_info.get("idleTimeout")
+            ))
+
+        results = await asyncio.gather(*attempts, return_exceptions=True)
+
+        for server_name, result in zip(names, results):
+            connection = self.connections.get(server_name)
+            if isinstance(result, BaseException):
+                # No connection if an in-process server failed to import
+                if connection is not None:
+                    await connection.stop()
+                self.connections.pop(server_name, None)
+                self.sessions = [(name, session) for name, session in self.sessions if name != server_name]
+                status = "unavailable"
+                error = (connection.error if connection is not None else None) or str(result)
+            else:
+                # "ready", or "idle" for a lazy server that isn't running
+                status = connection.status
+                error = None
+            report.append({
+                "server": server_name,
+                "status": status,
+                "seconds": round(connection.startup_time or 0.0, 3) if connection is not None else 0.0,
+                "error": error
+            })
+
+        self.startup_report = report
+        print_startup_report(report)
+        return report
+
+    def start_supervisor(self, **options):
+        """Start health checks that restart dead or hung servers, options go to ServerSupervisor"""
+        if self.supervisor is None:
+            self.supervisor = ServerSupervisor(self.connections, self._on_server_restarted, **options)
+            self.supervisor.start()
+
+    async def _on_server_restarted(self, server_name: str, session: ClientSession):
+        """Swap a restarted server's new session into the routing table"""
+        self.sessions = [
+            (name, session if name == server_name else old_session)
+            for name, old_session in self.sessions
+        ]
+        await self._load_server_tools(server_name, session)
+
+    def _load_tool_snapshot(self, server_name: str, params: StdioServerParameters) -> bool:
+        """Fill in a lazy server's tools from the snapshot, refreshing them in the background if it is old"""
+        if self.tool_snapshot is None:
+            return False
+        saved = self.tool_snapshot.get(server_name, server_key(params))
+        if saved is None:
+            return False
+
+        tools, saved_at = saved
+        self.server_tools[server_name] = tools
+        self._catalog_loaded_at[server_name] = time.monotonic()
+        self._rebuild_catalog()
+        if time.time() - saved_at > self.tool_snapshot_max_age:
+            self._run_in_background(self._refresh_lazy_server(server_name))
+        return True
+
+    def _on_lazy_server_spawned(self, server_name: str):
+        """Record the spawn and refresh the tools, which may have come from an old snapshot"""
+        connection = self.connections[server_name]
+        metrics.observe("mcp_connect_seconds", connection.startup_time or 0.0, server=server_name, status="lazy")
+        metrics.inc("mcp_lazy_spawns_total", server=server_name)
+        if server_name in self.server_tools:
+            self._run_in_background(self._refresh_lazy_server(server_name))
+
+    async def _refresh_lazy_server(self, server_name: str):
+        """Reload a lazy server's tools, spawning it if needed"""
+        connection = self.connections.get(server_name)
+        if not isinstance(connection, LazyServerConnection):
+            return
+        try:
+            async with asyncio.timeout(connection.startup_timeout):
+                async with connection.use() as session:
+                    await self._load_server_tools(server_name, session)
+        except Exception as e:
+            print(f"Could not refresh tools of lazy server {server_name}: {str(e) or type(e).__name__}")
+
+    def _run_in_background(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    def _make_message_handler(self, server_name: str):
+        """Build a message handler that invalidates the server's cached tools on tools/list_changed"""
+        async def handle_message(message) -> None:
+            if isinstance(message, types.ServerNotification) and isinstance(message.root, types.ToolListChangedNotification):
+                print(f"Tool list changed on server {server_name}, catalog will be refreshed")
+                self._stale_servers.add(server_name)
+                self.tool_cache.invalidate(server_name)
+        return handle_message
+
+    async def _load_server_tools(self, server_name: str, session: ClientSession):
+        """Fetch the tool list of one server and rebuild the aggregated catalog"""
+        with metrics.time("mcp_list_tools_seconds", server=server_name):
+            response = await session.list_tools()
+        self.server_tools[server_name] = response.tools
+        self._catalog_loaded_at[server_name] = time.monotonic()
+        connection = self.connections.get(server_name)
+        if self.tool_snapshot is not None and connection is not None and connection.params is not None:
+            self.tool_snapshot.put(server_name, server_key(connection.params), response.tools)
+        self._stale_servers.discard(server_name)
+        self._rebuild_catalog()
+
+    def _rebuild_catalog(self):
+        """Rebuild the Groq tool list and tool to session routing table from the cached tools"""
         available_tools = []
         tool_session_map = {}
+        sessions = dict(self.sessions)
 
-        for server_name, session in self.sessions:
-            response = await session.list_tools()
-            for tool in response.tools:
+        for server_name, connection in self.connections.items():
+            # Lazy servers are routed through their connection, there may be no session yet
+            if server_name not in sessions and not isinstance(connection, LazyServerConnection):
+                continue
+            session = sessions.get(server_name)
+            for tool in self.server_tools.get(server_name, []):
                 tool_name = f"{server_name}::{tool.name}"
                 available_tools.append({
                     "type": "function",
@@ -57,55 +461,440 @@ class MCPClient:
                     }
                 })
                 tool_session_map[tool_name] = session
-        
-        messages = [
-            {
-                "role": "user",
-                "content": query
-            }
-        ]
 
-        print(messages)
+        # Swap in new objects so queries already holding the old catalog are unaffected
+        self.available_tools = available_tools
+        self.tool_session_map = tool_session_map
+        self.tool_index = ToolIndex(available_tools)
+        self.catalog_fingerprint = hashlib.sha256(
+            json.dumps(sorted(available_tools, key=lambda tool: tool["function"]["name"]), sort_keys=True).encode()
+        ).hexdigest()
 
-        final_text = []
-        tool_results = []
+    def select_tools(self, query: str) -> list[dict]:
+        """Pick the tools relevant to a query from the catalog and record how much prompt it saved"""
+        tool_index = self.tool_index
+        selected, fell_back = tool_index.select(query, self.tool_top_k)
 
-        while True:
-            # Call Groq API with tools
-            groq_response = await self.groq.chat.completions.create(
+        offered = {tool["function"]["name"] for tool in selected}
+        saved_chars = sum(
+            len(json.dumps(tool)) for tool in tool_index.tools
+            if tool["function"]["name"] not in offered
+        )
+
+        stats = self.tool_selection_stats
+        stats["requests"] += 1
+        stats["fallbacks"] += int(fell_back)
+        stats["tools_offered"] += len(selected)
+        stats["tools_total"] += len(tool_index.tools)
+        stats["schema_tokens_saved"] += saved_chars // CHARS_PER_TOKEN
+        return selected
+
+    async def refresh_tools(self, server_name: Optional[str] = None):
+        """Force a reload of the tool catalog for one server, or all servers if none is given"""
+        for name, session in self.sessions:
+            if server_name is None or name == server_name:
+                await self._load_server_tools(name, session)
+        for name, connection in list(self.connections.items()):
+            if isinstance(connection, LazyServerConnection) and (server_name is None or name == server_name):
+                await self._refresh_lazy_server(name)
+
+    async def get_tool_catalog(self, deadline: Optional[float] = None) -> tuple[list[dict], dict[str, Optional[ClientSession]]]:
+        """
+        Return the cached tool catalog, reloading only servers that are stale or past the TTL.
+
+        With a deadline a reload that does not finish in time is abandoned and
+        the server's previous tools are used, it is retried on the next call.
+        """
+        now = time.monotonic()
+        for server_name, connection in list(self.connections.items()):
+            expired = (
+                self.catalog_ttl is not None
+                and now - self._catalog_loaded_at.get(server_name, 0.0) > self.catalog_ttl
+            )
+            if server_name not in self._stale_servers and not expired:
+                continue
+            # A dead or restarting server keeps its previous tools until the supervisor brings it back,
+            # idle lazy servers keep their snapshot tools
+            if connection.status != "ready" or connection.session is None:
+                continue
+            timeout = time_left(deadline) if deadline is not None else None
+            try:
+                await asyncio.wait_for(self._reload_server_tools(server_name, connection), timeout)
+            except asyncio.TimeoutError:
+                print(f"Listing tools of {server_name} timed out, using its previous tools")
+                self._stale_servers.add(server_name)
+            except Exception as e:
+                print(f"Listing tools of {server_name} failed ({str(e) or type(e).__name__}), using its previous tools")
+                self._stale_servers.add(server_name)
+        return self.available_tools, self.tool_session_map
+
+    async def _reload_server_tools(self, server_name: str, connection: ServerConnection):
+        """List a running server's tools again, a lazy one is held in use so it is not reaped meanwhile"""
+        if isinstance(connection, LazyServerConnection):
+            async with connection.use() as session:
+                await self._load_server_tools(server_name, session)
+        else:
+            await self._load_server_tools(server_name, connection.session) #type: ignore
+
+    async def _execute_tool_call(self, tool_call, tool_session_map: dict[str, Optional[ClientSession]], deadline: float):
+        """Run a single tool call before the deadline, returning its parsed args and the result or an error string"""
+        tool_name = tool_call.function.name
+
+        # tool_args is a JSON string, parse it
+        try:
+            tool_args_dict = json.loads(tool_call.function.arguments)
+        except Exception:
+            tool_args_dict = {}
+
+        if tool_name not in tool_session_map:
+            return tool_args_dict, f"Tool {tool_name} not found"
+        session = tool_session_map[tool_name]
+
+        #Remove server name from tool name to call the tool
+        server_name, actual_tool_name = tool_name.split("::",1)
+
+        started = time.perf_counter()
+        cached = self.tool_cache.get(server_name, actual_tool_name, tool_args_dict)
+        if cached is not None:
+            self._record_tool_call(server_name, actual_tool_name, "cached", started)
+            return tool_args_dict, cached
+
+        # Always go through the live connection, the server may have been restarted mid query
+        connection = self.connections.get(server_name)
+        lazy = isinstance(connection, LazyServerConnection)
+        if connection is not None and not lazy:
+            if connection.status != "ready" or connection.session is None:
+                self._record_tool_call(server_name, actual_tool_name, "unavailable", started)
+                return tool_args_dict, f"Server {server_name} is unavailable ({connection.status}), try again later"
+            session = connection.session
+
+        try:
+            remaining = time_left(deadline)
+            with tracer.span("mcp.call_tool", kind=KIND_CLIENT, server=server_name, tool=actual_tool_name) as span:
+                async with asyncio.timeout(remaining):
+                    # A lazy server is spawned here if needed and kept up until the call is done
+                    async with (connection.use() if lazy else nullcontext(session)) as session: #type: ignore
+                        async with self.server_semaphores[server_name]:
+                            # The request id and trace context travel with the call in _meta
+                            result = await session.call_tool(
+                                actual_tool_name,
+                                tool_args_dict,
+                                read_timeout_seconds=timedelta(seconds=remaining),
+                                meta=tracer.propagation_meta()
+                            )
+                if span is not None and result.isError:
+                    span.set_error("tool returned an error")
+        except (asyncio.TimeoutError, QueryTimeoutError):
+            self._record_tool_call(server_name, actual_tool_name, "timeout", started)
+            return tool_args_dict, f"Tool {tool_name} did not finish before the query deadline"
+        except Exception as e:
+            # Keep the failure local to this call so sibling calls still report their results
+            self._record_tool_call(server_name, actual_tool_name, "error", started)
+            return tool_args_dict, f"Error calling tool {tool_name}: {str(e)}"
+
+        self._record_tool_call(server_name, actual_tool_name, "error" if result.isError else "ok", started)
+        self.tool_cache.put(server_name, actual_tool_name, tool_args_dict, result)
+        return tool_args_dict, result
+
+    def _reuse_tool_result(self, conversation: Conversation, tool_call) -> Optional[tuple[dict, Any]]:
+        """The earlier result of the same call in this conversation, as _execute_tool_call would return it"""
+        try:
+            tool_args_dict = json.loads(tool_call.function.arguments)
+        except Exception:
+            return None
+        result = conversation.lookup(tool_call.function.name, tool_args_dict)
+        if result is None:
+            return None
+        server_name, actual_tool_name = tool_call.function.name.split("::", 1)
+        self._record_tool_call(server_name, actual_tool_name, "reused", time.perf_counter())
+        print(f"Reusing earlier result of {tool_call.function.name} from this conversation")
+        return tool_args_dict, result
+
+    def _record_tool_call(self, server_name: str, tool_name: str, status: str, started: float):
+        """Count a tool call and record its latency, labelled by server, tool and outcome"""
+        metrics.inc("mcp_tool_calls_total", server=server_name, tool=tool_name, status=status)
+        metrics.observe("mcp_tool_call_seconds", time.perf_counter() - started, server=server_name, tool=tool_name, status=status)
+
+    async def _summarize_tool_output(self, content: str) -> str:
+        """Ask a small Groq model for a short summary of an old tool output"""
+        groq_response = await self.llm.create(
+            model=self.summary_model,
+            max_tokens=200,
+            messages=[
+                {
+                    "role": "system",
+                    "content": "Summarise this tool output in a few sentences. Keep numbers, names and anything needed to answer follow up questions."
+                },
+                {
+                    "role": "user",
+                    "content": content
+                }
+            ]
+        )
+        return groq_response.choices[0].message.content or ""
+
+    async def _complete(self, messages: list[dict], available_tools: list[dict], stream: bool, deadline: float):
+        """
+        Run one Groq completion that must finish before the deadline.
+
+        With stream=True content deltas are yielded as token events while they
+        arrive. Either way the last event carries the assembled assistant message.
+        """
+        with tracer.span("llm.completion", kind=KIND_CLIENT, model="llama-3.3-70b-versatile", stream=stream, tools=len(available_tools)):
+            async with aclosing(self._run_completion(messages, available_tools, stream, deadline)) as events:
+                async for event in events:
+                    yield event
+
+    async def _run_completion(self, messages: list[dict], available_tools: list[dict], stream: bool, deadline: float):
+        """The Groq call behind _complete"""
+        started = time.perf_counter()
+        if not stream:
+            groq_response = await asyncio.wait_for(
+                self.llm.create(
+                    deadline=deadline,
+                    model="llama-3.3-70b-versatile",
+                    max_tokens=1500,
+                    messages=messages, #type:ignore
+                    tools=available_tools,
+                    tool_choice="auto"
+                ),
+                time_left(deadline)
+            )
+            message = groq_response.choices[0].message
+            metrics.observe("mcp_llm_completion_seconds", time.perf_counter() - started, stream="false")
+            yield {"type": "message", "content": message.content, "tool_calls": message.tool_calls or []}
+            return
+
+        groq_stream = await asyncio.wait_for(
+            self.llm.create(
+                deadline=deadline,
                 model="llama-3.3-70b-versatile",
                 max_tokens=1500,
                 messages=messages, #type:ignore
                 tools=available_tools,
-                tool_choice="auto"
+                tool_choice="auto",
+                stream=True
+            ),
+            time_left(deadline)
+        )
+
+        content_parts = []
+        partial_calls: dict[int, dict] = {}
+        chunks = groq_stream.__aiter__()
+        try:
+            while True:
+                # Each chunk has to arrive before the deadline, not just the first byte
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), time_left(deadline))
+                except StopAsyncIteration:
+                    break
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+
+                if delta.content:
+                    content_parts.append(delta.content)
+                    yield {"type": "token", "content": delta.content}
+
+                # Tool calls may be split over several chunks, stitch them together by index
+                for call_delta in delta.tool_calls or []:
+                    partial = partial_calls.setdefault(call_delta.index, {"id": "", "name": "", "arguments": ""})
+                    if call_delta.id:
+                        partial["id"] = call_delta.id
+                    if call_delta.function:
+                        partial["name"] += call_delta.function.name or ""
+                        partial["arguments"] += call_delta.function.arguments or ""
+        finally:
+            # Release the HTTP connection if we stopped reading early
+            await groq_stream.close()
+
+        tool_calls = [
+            ChatCompletionMessageToolCall(
+                id=partial["id"],
+                type="function",
+                function=Function(name=partial["name"], arguments=partial["arguments"])
             )
+            for _, partial in sorted(partial_calls.items())
+        ]
+        metrics.observe("mcp_llm_completion_seconds", time.perf_counter() - started, stream="true")
+        yield {"type": "message", "content": "".join(content_parts) or None, "tool_calls": tool_calls}
 
-            message = groq_response.choices[0].message
+    async def stream_query(
+        self,
+        query: str,
+        stream_tokens: bool = True,
+        timeout: Optional[float] = None,
+        conversation: Optional[Conversation] = None
+    ):
+        """
+        Process a query using Groq and available tools, yielding events as they happen.
+
+        Events are dicts with a "type" of token, tool_call, tool_result or final.
+        The final event carries the same response text process_query returns and
+        whether it came from the response cache.
+        The whole query has timeout seconds (query_timeout by default, at most
+        max_query_timeout) and at most max_iterations LLM rounds, past the
+        deadline QueryTimeoutError is raised.
+        With a conversation, a window of its earlier turns is sent along, its tool
+        results are reused and the finished turn is added to it.
+        """
+        started = time.perf_counter()
+        status = "error"
+        # Queries from the CLI get their own request id, app.py sets one per HTTP request
+        request_id_token = current_request_id.set(current_request_id.get() or new_request_id())
+        try:
+            with tracer.span("mcp.query", stream=stream_tokens) as span:
+                # aclosing makes sure the loop's own cleanup runs if our consumer stops early
+                async with aclosing(self._agent_loop(query, stream_tokens, timeout, conversation)) as events:
+                    async for event in events:
+                        if event["type"] == "final":
+                            status = "cached" if event["cached"] else "ok"
+                        yield event
+                if span is not None:
+                    span.set_attribute("query.status", status)
+        except QueryTimeoutError:
+            status = "timeout"
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            status = "cancelled"
+            raise
+        finally:
+            metrics.inc("mcp_queries_total", status=status)
+            metrics.observe("mcp_query_seconds", time.perf_counter() - started, status=status)
+            try:
+                current_request_id.reset(request_id_token)
+            except ValueError:
+                pass
+
+    async def _agent_loop(self, query: str, stream_tokens: bool, timeout: Optional[float], conversation: Optional[Conversation]):
+        """The agent loop behind stream_query: Groq rounds and tool calls until a final answer"""
+        timeout = min(timeout, self.max_query_timeout) if timeout is not None else self.query_timeout
+        deadline = time.monotonic() + timeout
+
+        # Get available tools from the cached catalog
+        print(f"Processing query: {query}")
+        _, tool_session_map = await self.get_tool_catalog(deadline)
+
+        # A follow up depends on what came before, only a conversation's first query can use the cache
+        use_response_cache = self.response_cache is not None and (conversation is None or not conversation.turns)
+        if use_response_cache:
+            cached = self.response_cache.get(query, self.catalog_fingerprint) #type: ignore
+            if cached is not None:
+                print("Answered from response cache")
+                if conversation is not None:
+                    # Still a turn of the conversation, follow ups need it as history
+                    conversation.add_turn([{"role": "user", "content": query}, {"role": "assistant", "content": cached}])
+                yield {"type": "final", "response": cached, "cached": True}
+                return
+        fingerprint = self.catalog_fingerprint
+        cacheable = True
+
+        available_tools = self.select_tools(query)
+        print(f"Offering {len(available_tools)} of {len(tool_session_map)} tools")
+
+        messages = conversation.history(self.history_turns, self.history_tokens) if conversation is not None else []
+        history_length = len(messages)
+        messages.append({
+            "role": "user",
+            "content": query
+        })
 
-            # If Groq returns tool calls, execute them
-            if hasattr(message, "tool_calls") and message.tool_calls:
-                for tool_call in message.tool_calls:
-                    tool_name = tool_call.function.name
-                    tool_args = tool_call.function.arguments
+        print(messages)
+
+        final_text = []
+        tool_results = []
+        answer = ""
+
+        context = ContextWindow(
+            max_tokens=self.context_budget,
+            policy=self.context_policy,
+            summarizer=self._summarize_tool_output
+        )
+        turn_start = len(messages)
+        encoding_saved = 0
+        iterations = 0
+
+        while True:
+            if iterations >= self.max_iterations:
+                final_text.append(f"[Stopped after {iterations} iterations without a final answer]")
+                cacheable = False
+                break
+            iterations += 1
+
+            with tracer.span("agent.iteration", iteration=iterations):
+                message = None
+                try:
+                    # Keep the history under budget, only outputs from earlier turns get compacted
+                    await asyncio.wait_for(context.fit(messages, protected_from=turn_start), time_left(deadline))
+
+                    # Call Groq API with tools
+                    async with aclosing(self._complete(messages, available_tools, stream=stream_tokens, deadline=deadline)) as events:
+                        async for event in events:
+                            if event["type"] == "message":
+                                message = event
+                            else:
+                                yield event
+                except (asyncio.TimeoutError, APITimeoutError):
+                    # Groq's own timeout only fires after the deadline, either way the query is out of time
+                    raise QueryTimeoutError("Query deadline exceeded while waiting for Groq") from None
 
-                    # tool_args is a JSON string, parse it
+                # If Groq returns tool calls, execute them
+                if message and message["tool_calls"]:
+                    tool_calls = message["tool_calls"]
+                    for tool_call in tool_calls:
+                        yield {
+                            "type": "tool_call",
+                            "id": tool_call.id,
+                            "name": tool_call.function.name,
+                            "arguments": tool_call.function.arguments
+                        }
+
+                    # Run every tool call of this turn concurrently, report each one as it finishes
+                    async def run_indexed(index, tool_call):
+                        if conversation is not None:
+                            reused = self._reuse_tool_result(conversation, tool_call)
+                            if reused is not None:
+                                return index, reused, True
+                        return index, await self._execute_tool_call(tool_call, tool_session_map, deadline), False
+
+                    tasks = [asyncio.create_task(run_indexed(index, tool_call)) for index, tool_call in enumerate(tool_calls)]
+                    call_results: list = [None] * len(tool_calls)
+                    encoded_results: list[str] = [""] * len(tool_calls)
                     try:
-                        tool_args_dict = json.loads(tool_args)
-                    except Exception:
-                        tool_args_dict = {}
-
-                    session = tool_session_map.get(tool_name)
-
-                    if session is None:
-                        result = f"Tool {tool_name} not found in session {session}"
-                    else:
-                        #Remove server name from tool name to call the tool
-                        _, actual_tool_name = tool_name.split("::",1)
-                        result = await session.call_tool(actual_tool_name, tool_args_dict)
-                        tool_results.append({"call": tool_name, "result": result})
-                        final_text.append(f"[Calling tool {tool_name} with args {tool_args_dict}]")
-
-                    # Add tool call and result to messages for next round
+                        for next_done in asyncio.as_completed(tasks):
+                            index, (tool_args_dict, result), reused = await next_done
+                            call_results[index] = (tool_args_dict, result)
+
+                            with metrics.time("mcp_result_encode_seconds"):
+                                encoded = encode_result(result, self.tool_result_max_chars)
+                            encoded_results[index] = encoded
+                            encoding_saved += len(legacy_encoding(result).encode()) - len(encoded.encode())
+
+                            tool_name = tool_calls[index].function.name
+                            # A reused result keeps its original age, so it still expires after result_ttl
+                            if (
+                                conversation is not None
+                                and not reused
+                                and not isinstance(result, str)
+                                and not result.isError
+                                and tool_name not in self.uncacheable_tools
+                            ):
+                                conversation.remember(tool_name, tool_args_dict, result, len(encoded))
+
+                            yield {
+                                "type": "tool_result",
+                                "id": tool_calls[index].id,
+                                "name": tool_calls[index].function.name,
+                                "is_error": isinstance(result, str) or bool(getattr(result, "isError", False)),
+                                "content": encoded
+                            }
+                    finally:
+                        # The consumer went away or the query was cancelled, don't leave tool calls running
+                        for task in tasks:
+                            task.cancel()
+
+                    # One assistant message carries every call of the turn, results follow in call order
+                    turn_start = len(messages)
                     messages.append({
                         "role": "assistant",
                         "tool_calls": [
@@ -113,31 +902,72 @@ class MCPClient:
                                 "id": tool_call.id,
                                 "type": "function",
                                 "function": {
-                                    "name": tool_name,
-                                    "arguments": tool_args
+                                    "name": tool_call.function.name,
+                                    "arguments": tool_call.function.arguments
                                 }
                             }
+                            for tool_call in tool_calls
                         ] #type: ignore
                     })
-                    messages.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "content": str(result.content) if hasattr(result, "content") else str(result) #type:ignore
-                    })
-                # Continue the loop to let Groq process the tool results
-                continue
 
-            # If no tool calls, return the response
-            if hasattr(message, "content") and message.content:
-                final_text.append(message.content)
-            break
+                    for tool_call, (tool_args_dict, result), encoded in zip(tool_calls, call_results, encoded_results):
+                        tool_name = tool_call.function.name
+
+                        # Failed calls and nondeterministic tools make the answer unsafe to reuse
+                        if isinstance(result, str) or result.isError or tool_name in self.uncacheable_tools:
+                            cacheable = False
+
+                        if not isinstance(result, str):
+                            tool_results.append({"call": tool_name, "result": result})
+                            final_text.append(f"[Calling tool {tool_name} with args {tool_args_dict}]")
+
+                        messages.append({
+                            "role": "tool",
+                            "tool_call_id": tool_call.id,
+                            "content": encoded
+                        })
+                    # Continue the loop to let Groq process the tool results
+                    continue
+
+                # If no tool calls, return the response
+                if message and message["content"]:
+                    final_text.append(message["content"])
+                    answer = message["content"]
+                break
+
+        self.context_stats["requests"] += 1
+        self.context_stats["compacted"] += context.compacted
+        self.context_stats["tokens_saved"] += context.tokens_saved
+        if context.compacted:
+            print(f"Context: compacted {context.compacted} tool outputs, saved ~{context.tokens_saved} tokens")
+
+        self.encoding_stats["requests"] += 1
+        self.encoding_stats["bytes_saved"] += encoding_saved
+        if encoding_saved:
+            print(f"Result encoding: saved {encoding_saved} bytes (~{encoding_saved // CHARS_PER_TOKEN} tokens) of tool output")
+
+        response = "\n".join(final_text)
+        if use_response_cache and cacheable and response:
+            self.response_cache.put(query, fingerprint, response) #type: ignore
+
+        if conversation is not None:
+            # The turn as the LLM saw it, tool outputs included, so the next query can build on it
+            conversation.add_turn(messages[history_length:] + [{"role": "assistant", "content": answer or response}])
 
-        return "\n".join(final_text)
+        yield {"type": "final", "response": response, "cached": False}
+
+    async def process_query(self, query: str, timeout: Optional[float] = None, conversation: Optional[Conversation] = None) -> str:
+        """Process a query using Groq and available tools"""
+        response = ""
+        async for event in self.stream_query(query, stream_tokens=False, timeout=timeout, conversation=conversation):
+            if event["type"] == "final":
+                response = event["response"]
+        return response
 
     async def chat_loop(self):
         """Run an interactive chat loop"""
         print("\nMCP Client Started!")
-        print("Type your queries or 'quit' to exit.")
+        print("Type your queries, 'refresh' to reload the tool list, 'stats' for cache statistics, 'metrics' for latency metrics or 'quit' to exit.")
         
         while True:
             try:
@@ -145,6 +975,25 @@ class MCPClient:
                 print(f"Processing query {query}")
                 if query.lower() == 'quit':
                     break
+                if query.lower() == 'refresh':
+                    await self.refresh_tools()
+                    print(f"Reloaded {len(self.available_tools)} tools")
+                    continue
+                if query.lower() == 'stats':
+                    print(f"Tool cache: {self.tool_cache.stats()}")
+                    print(f"Context: {self.context_stats}")
+                    print(f"Tool selection: {self.tool_selection_stats}")
+                    print(f"Result encoding: {self.encoding_stats}")
+                    print(f"LLM gateway: {self.llm.stats()}")
+                    for name, connection in self.connections.items():
+                        if isinstance(connection, LazyServerConnection):
+                            print(f"Lazy server {name}: {connection.status}, {connection.spawns} spawns, {connection.idle_shutdowns} idle shutdowns")
+                    if self.response_cache is not None:
+                        print(f"Response cache: {self.response_cache.stats()}")
+                    continue
+                if query.lower() == 'metrics':
+                    print(metrics.render())
+                    continue
                     
                 response = await self.process_query(query)
                 print("\n" + response)
@@ -154,7 +1003,30 @@ class MCPClient:
     
     async def cleanup(self):
         """Clean up resources"""
-        await self.exit_stack.aclose()
+        if self.supervisor is not None:
+            await self.supervisor.stop()
+            self.supervisor = None
+        for task in list(self._background_tasks):
+            task.cancel()
+        await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        await asyncio.gather(*[connection.stop() for connection in self.connections.values()])
+        self.connections.clear()
+        self.sessions.clear()
+        if self.broker_link is not None:
+            await self.broker_link.close()
+            self.broker_link = None
+        if self.response_cache is not None:
+            self.response_cache.close()
+
+
+def print_startup_report(report: list[dict]):
+    """Print how long each server took to start and whether it is usable"""
+    print("\nServer startup report:")
+    for entry in report:
+        line = f"  {entry['server']:<20} {entry['status']:<12} {entry['seconds']:>7.2f}s"
+        if entry["error"]:
+            line += f"  ({entry['error']})"
+        print(line)
 
 async def main():
     if len(sys.argv) < 2:
@@ -174,15 +1046,16 @@ async def main():
         print("No MCP servers found in the configuration.")
         sys.exit(1)
     
-    client = MCPClient()
+    client = MCPClient(
+        response_cache_ttl=float(os.environ["RESPONSE_CACHE_TTL"]) if os.environ.get("RESPONSE_CACHE_TTL") else None,
+        response_cache_path=os.environ.get("RESPONSE_CACHE_PATH"),
+        llm_requests_per_minute=float(os.environ["LLM_REQUESTS_PER_MINUTE"]) if os.environ.get("LLM_REQUESTS_PER_MINUTE") else None,
+        llm_tokens_per_minute=float(os.environ["LLM_TOKENS_PER_MINUTE"]) if os.environ.get("LLM_TOKENS_PER_MINUTE") else None,
+        tool_snapshot_path=os.environ.get("TOOL_SNAPSHOT_PATH")
+    )
     try:
-        for server_name, server_info in servers.items():
-            command = server_info.get("command")
-            args = server_info.get("args", [])
-            if not command or not args:
-                print(f"Command not found for server {server_name}:{server_info}.")
-                continue
-            await client.connect_to_server(server_name, command, args)
+        await client.connect_to_servers(servers)
+        client.start_supervisor()
         await client.chat_loop()
     finally:
         await client.cleanup()
@@ -0,0 +1,87 @@
+from typing import Awaitable, Callable, Optional
+
+# Rough chars per token for English text and JSON, good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+POLICIES = ("truncate", "summarize", "drop")
+
+
+def estimate_tokens(message: dict) -> int:
+    """Approximate the number of tokens a chat message will cost"""
+    size = len(message.get("content") or "")
+    for tool_call in message.get("tool_calls") or []:
+        size += len(tool_call["function"]["name"]) + len(tool_call["function"]["arguments"])
+    # Small fixed overhead for role and message framing
+    return size // CHARS_PER_TOKEN + 4
+
+
+class ContextWindow:
+    """
+    Keeps the messages of one request under an approximate token budget.
+
+    When the history grows past max_tokens, tool outputs from earlier turns are
+    compacted oldest first until it fits again. The policy decides how:
+    truncate keeps the head of the output, summarize replaces it with a short
+    summary from the summarizer callable (falling back to truncate if that fails)
+    and drop replaces it with a placeholder. Tool outputs of the current turn are
+    never touched.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 6000,
+        policy: str = "truncate",
+        truncate_chars: int = 800,
+        summarizer: Optional[Callable[[str], Awaitable[str]]] = None
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown context policy {policy}, expected one of {POLICIES}")
+
+        self.max_tokens = max_tokens
+        self.policy = policy
+        self.truncate_chars = truncate_chars
+        self.summarizer = summarizer
+
+        self.compacted = 0
+        self.tokens_saved = 0
+        self._compacted_ids: set[str] = set()
+
+    async def fit(self, messages: list[dict], protected_from: int) -> None:
+        """Compact tool messages before index protected_from until messages fit the budget"""
+        total = sum(estimate_tokens(message) for message in messages)
+        if total <= self.max_tokens:
+            return
+
+        for message in messages[:protected_from]:
+            if total <= self.max_tokens:
+                break
+            if message.get("role") != "tool" or message["tool_call_id"] in self._compacted_ids:
+                continue
+
+            before = estimate_tokens(message)
+            message["content"] = await self._compact(message["content"])
+            self._compacted_ids.add(message["tool_call_id"])
+
+            saved = before - estimate_tokens(message)
+            if saved > 0:
+                total -= saved
+                self.tokens_saved += saved
+                self.compacted += 1
+
+    async def _compact(self, content: str) -> str:
+        """Shrink one tool output according to the policy"""
+        if self.policy == "drop":
+            return "[tool output removed to save context]"
+
+        if self.policy == "summarize" and self.summarizer is not None:
+            try:
+                summary = await self.summarizer(content)
+                if summary:
+                    return f"[summary of earlier tool output] {summary}"
+            except Exception as e:
+                print(f"Summarising tool output failed, truncating instead: {str(e)}")
+
+        if len(content) <= self.truncate_chars:
+            return content
+        omitted = len(content) - self.truncate_chars
+        return f"{content[:self.truncate_chars]}... [truncated {omitted} chars]"
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import secrets
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from context_window import estimate_tokens
+
+
+def _args_key(tool_name: str, args: dict) -> str:
+    return f"{tool_name}\n{json.dumps(args, sort_keys=True, separators=(',', ':'))}"
+
+
+class Conversation:
+    """
+    History and tool results of one conversation.
+
+    turns holds the messages of each finished query (user message, tool calls,
+    tool results, answer). Successful tool results are remembered by tool and
+    arguments for result_ttl seconds so a follow up question can reuse them
+    instead of calling the tool again. lock serializes queries on the same
+    conversation.
+    """
+
+    def __init__(self, conversation_id: str, max_turns: int = 50, result_ttl: float = 300.0):
+        self.id = conversation_id
+        self.max_turns = max_turns
+        self.result_ttl = result_ttl
+        self.turns: list[list[dict]] = []
+        self.tool_results: dict[str, tuple[float, Any, int]] = {}
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+        self.size = 0
+        self.reused = 0
+        self._history_bytes = 0
+
+    def history(self, max_turns: int, max_tokens: int) -> list[dict]:
+        """The most recent whole turns that fit both limits, oldest first"""
+        window: list[list[dict]] = []
+        tokens = 0
+        for turn in reversed(self.turns[-max_turns:] if max_turns > 0 else []):
+            turn_tokens = sum(estimate_tokens(message) for message in turn)
+            if tokens + turn_tokens > max_tokens:
+                break
+            window.append(turn)
+            tokens += turn_tokens
+        # Copies, the context window compacts the messages it is given in place
+        return [dict(message) for turn in reversed(window) for message in turn]
+
+    def add_turn(self, messages: list[dict]):
+        self.turns.append(messages)
+        if len(self.turns) > self.max_turns:
+            del self.turns[:len(self.turns) - self.max_turns]
+        self._history_bytes = sum(len(json.dumps(message)) for turn in self.turns for message in turn)
+        self._resize()
+
+    def lookup(self, tool_name: str, args: dict) -> Optional[Any]:
+        """A result this conversation already got for the same call, if it is still fresh"""
+        entry = self.tool_results.get(_args_key(tool_name, args))
+        if entry is None:
+            return None
+        stored_at, result, _ = entry
+        if time.monotonic() - stored_at > self.result_ttl:
+            self.tool_results.pop(_args_key(tool_name, args), None)
+            self._resize()
+            return None
+        self.reused += 1
+        return result
+
+    def remember(self, tool_name: str, args: dict, result: Any, size: int):
+        self.tool_results[_args_key(tool_name, args)] = (time.monotonic(), result, size)
+        self._resize()
+
+    def _resize(self):
+        """Approximate bytes held, what the store's memory cap is checked against"""
+        self.size = self._history_bytes + sum(size for _, _, size in self.tool_results.values())
+
+
+class ConversationStore:
+    """
+    In-memory conversations with LRU eviction, an idle TTL and a memory cap.
+
+    A conversation unused for ttl seconds is dropped on the next access. Past
+    max_conversations or max_bytes the least recently used ones are evicted.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 1800.0,
+        max_conversations: int = 1000,
+        max_bytes: int = 50_000_000,
+        max_turns: int = 50,
+        result_ttl: float = 300.0
+    ):
+        self.ttl = ttl
+        self.max_conversations = max_conversations
+        self.max_bytes = max_bytes
+        self.max_turns = max_turns
+        self.result_ttl = result_ttl
+
+        self._conversations: OrderedDict[str, Conversation] = OrderedDict()
+        self.created = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def create(self) -> Conversation:
+        conversation = Conversation(secrets.token_urlsafe(12), self.max_turns, self.result_ttl)
+        self._conversations[conversation.id] = conversation
+        self.created += 1
+        self._enforce_limits()
+        return conversation
+
+    def get(self, conversation_id: str) -> Optional[Conversation]:
+        """The conversation, or None if it never existed, expired or was evicted"""
+        self._expire()
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None:
+            return None
+        conversation.last_used = time.monotonic()
+        self._conversations.move_to_end(conversation_id)
+        return conversation
+
+    def delete(self, conversation_id: str) -> bool:
+        return self._conversations.pop(conversation_id, None) is not None
+
+    def touch(self, conversation: Conversation):
+        """Call after a conversation grew so the caps are checked again"""
+        conversation.last_used = time.monotonic()
+        if conversation.id in self._conversations:
+            self._conversations.move_to_end(conversation.id)
+        self._enforce_limits()
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        # Least recently used first, stop at the first one still in use
+        while self._conversations:
+            conversation = next(iter(self._conversations.values()))
+            if conversation.last_used >= cutoff:
+                break
+            self._conversations.popitem(last=False)
+            self.expirations += 1
+
+    def _enforce_limits(self):
+        self._expire()
+        total = sum(conversation.size for conversation in self._conversations.values())
+        while self._conversations and (len(self._conversations) > self.max_conversations or total > self.max_bytes):
+            _, conversation = self._conversations.popitem(last=False)
+            total -= conversation.size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """Conversation counts and approximate memory held"""
+        return {
+            "conversations": len(self._conversations),
+            "bytes": sum(conversation.size for conversation in self._conversations.values()),
+            "created": self.created,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "tool_results_reused": sum(conversation.reused for conversation in self._conversations.values())
+        }
@@ -0,0 +1,100 @@
+import math
+import sqlite3
+import time
+from typing import Optional
+
+# /points takes at most 4 decimals, more precision is answered with a redirect
+NWS_PRECISION = 4
+
+
+def round_coordinates(lat: float, lon: float) -> tuple[float, float]:
+    return round(lat, NWS_PRECISION), round(lon, NWS_PRECISION)
+
+
+class GridpointIndex:
+    """
+    Persistent map from coordinates to the NWS forecast URL of their grid cell.
+
+    Coordinates are rounded to NWS precision. A lookup also matches the closest
+    stored point within radius_km, grid cells are about 2.5km wide so a nearby
+    point almost always shares its forecast. Entries older than max_age seconds
+    are resolved again. Without a path the index lives in memory only.
+    """
+
+    def __init__(self, path: Optional[str] = None, radius_km: float = 1.0, max_age: float = 30 * 86400.0):
+        self.radius_km = radius_km
+        self.max_age = max_age
+        self.hits = 0
+        self.nearby_hits = 0
+        self.misses = 0
+
+        self._db = sqlite3.connect(path or ":memory:")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS gridpoints "
+            "(lat REAL, lon REAL, forecast_url TEXT, grid_id TEXT, grid_x INTEGER, grid_y INTEGER, resolved_at REAL, "
+            "PRIMARY KEY (lat, lon))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS gridpoints_lat_lon ON gridpoints (lat, lon)")
+        self._db.execute("DELETE FROM gridpoints WHERE resolved_at < ?", (time.time() - max_age,))
+        self._db.commit()
+
+    def lookup(self, lat: float, lon: float) -> Optional[str]:
+        """The forecast URL for the coordinates or a point near them, None if it has to be resolved"""
+        lat, lon = round_coordinates(lat, lon)
+        cutoff = time.time() - self.max_age
+        row = self._db.execute(
+            "SELECT forecast_url FROM gridpoints WHERE lat = ? AND lon = ? AND resolved_at >= ?",
+            (lat, lon, cutoff)
+        ).fetchone()
+        if row is not None:
+            self.hits += 1
+            return row[0]
+
+        if self.radius_km > 0:
+            # Bounding box on the index first, then the closest point actually inside the radius
+            lat_delta = self.radius_km / 111.0
+            lon_delta = self.radius_km / (111.0 * max(math.cos(math.radians(lat)), 0.01))
+            rows = self._db.execute(
+                "SELECT lat, lon, forecast_url FROM gridpoints "
+                "WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ? AND resolved_at >= ?",
+                (lat - lat_delta, lat + lat_delta, lon - lon_delta, lon + lon_delta, cutoff)
+            ).fetchall()
+            best = min(rows, key=lambda row: self._distance_km(lat, lon, row[0], row[1]), default=None)
+            if best is not None and self._distance_km(lat, lon, best[0], best[1]) <= self.radius_km:
+                self.nearby_hits += 1
+                return best[2]
+
+        self.misses += 1
+        return None
+
+    def store(self, lat: float, lon: float, properties: dict):
+        """Remember what /points returned for the coordinates"""
+        lat, lon = round_coordinates(lat, lon)
+        self._db.execute(
+            "INSERT OR REPLACE INTO gridpoints (lat, lon, forecast_url, grid_id, grid_x, grid_y, resolved_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (lat, lon, properties["forecast"], properties.get("gridId"), properties.get("gridX"), properties.get("gridY"), time.time())
+        )
+        self._db.commit()
+
+    def forget(self, forecast_url: str):
+        """Drop every point of a forecast URL the NWS no longer serves, they are resolved again"""
+        self._db.execute("DELETE FROM gridpoints WHERE forecast_url = ?", (forecast_url,))
+        self._db.commit()
+
+    @staticmethod
+    def _distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+        """Equirectangular approximation, plenty at a few kilometres"""
+        x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+        y = math.radians(lat2 - lat1)
+        return 6371.0 * math.hypot(x, y)
+
+    def close(self):
+        self._db.close()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "nearby_hits": self.nearby_hits,
+            "misses": self.misses,
+            "points": self._db.execute("SELECT COUNT(*) FROM gridpoints").fetchone()[0]
+        }
@@ -15,10 +15,12 @@ from mcp.client.sse import sse_client
 load_dotenv()
 
 class MCPClient:
-    def __init__(self) -> None:
+    def __init__(self, max_concurrent_calls: int = 4) -> None:
         self.session: ClientSession
         self.exit_stack = AsyncExitStack()
         self.groq = AsyncGroq(api_key=os.environ.get("GROQ_API_KEY"))
+        #limit in-flight tool calls so the server isn't flooded
+        self.call_semaphore = asyncio.Semaphore(max_concurrent_calls)
 
     async def connect_to_server(self):
         """Connect to dice roll server"""
@@ -32,6 +34,23 @@ class MCPClient:
         await session.initialize()
         self.session = session 
 
+    async def _execute_tool_call(self, tool_call):
+        """Run one tool call and return its parsed args with the result or an error string"""
+        tool_name = tool_call.function.name
+
+        try:
+            tool_args_dict = json.loads(tool_call.function.arguments)
+        except Exception:
+            tool_args_dict = {}
+
+        try:
+            async with self.call_semaphore:
+                result = await self.session.call_tool(tool_name, tool_args_dict)
+        except Exception as e:
+            #one failing call should not take down its siblings
+            return tool_args_dict, f"Error calling tool {tool_name}: {str(e)}"
+        return tool_args_dict, result
+
     async def process_query(self, query: str) -> str:
         """Process a query using Groq and available tools"""
         print(f"Processeing query {query}")
@@ -73,18 +92,18 @@ class MCPClient:
             message = groq_response.choices[0].message
 
             if hasattr(message, "tool_calls") and message.tool_calls:
-                for tool_call in message.tool_calls:
+                #run all tool calls of this turn concurrently, results keep the call order
+                call_results = await asyncio.gather(*[
+                    self._execute_tool_call(tool_call) for tool_call in message.tool_calls
+                ])
+
+                for tool_call, (tool_args_dict, result) in zip(message.tool_calls, call_results):
                     tool_name = tool_call.function.name
                     tool_args = tool_call.function.arguments
 
-                    try:
-                        tool_args_dict = json.loads(tool_args)
-                    except Exception:
-                        tool_args_dict = {}
-
-                    result = await self.session.call_tool(tool_name, tool_args_dict)
-                    tool_results.append({"call": tool_name, "result": result})
-                    final_text.append(f"[Calling Tool {tool_name} with args {tool_args_dict}]")
+                    if not isinstance(result, str):
+                        tool_results.append({"call": tool_name, "result": result})
+                        final_text.append(f"[Calling Tool {tool_name} with args {tool_args_dict}]")
 
                     messages.append({
                         "role": "assistant",
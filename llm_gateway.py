@@ -0,0 +1,199 @@
+import asyncio
+import json
+import random
+import time
+from typing import Any, Optional
+
+import groq
+
+from context_window import estimate_tokens
+from metrics import metrics
+
+# Status codes worth another try, everything else is the caller's problem
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+# Extra seconds Groq's own timeout gets past the deadline, so the deadline is what fires
+DEADLINE_GRACE = 1.0
+
+
+class TokenBucket:
+    """Refills continuously at per_minute / 60 per second up to per_minute, None means unlimited"""
+
+    def __init__(self, per_minute: Optional[float]):
+        self.per_minute = per_minute
+        self.level = per_minute or 0.0
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.per_minute is not None:
+            self.level = min(self.per_minute, self.level + (now - self._updated) * self.per_minute / 60)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available, 0 if it is now"""
+        if self.per_minute is None:
+            return 0.0
+        self._refill()
+        # A single request bigger than the whole quota still gets through once the bucket is full
+        amount = min(amount, self.per_minute)
+        return max(0.0, (amount - self.level) * 60 / self.per_minute)
+
+    def take(self, amount: float):
+        if self.per_minute is None:
+            return
+        self._refill()
+        self.level -= min(amount, self.per_minute)
+
+    def give_back(self, amount: float):
+        """Correct an estimate after the fact, a negative amount charges more"""
+        if self.per_minute is None:
+            return
+        self._refill()
+        self.level = min(self.per_minute, self.level + amount)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds the API asked us to wait, from Retry-After or Groq's reset headers"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    for header in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        value = response.headers.get(header)
+        if not value:
+            continue
+        try:
+            return float(value.rstrip("s"))
+        except ValueError:
+            continue
+    return None
+
+
+class LLMGateway:
+    """
+    Shared front door for every Groq chat completion the client makes.
+
+    Calls are scheduled in arrival order against requests and tokens per minute
+    quotas, so concurrent queries queue locally instead of tripping 429s. A call
+    is charged its prompt estimate plus max_tokens up front and corrected with
+    the real usage when the response reports it. 429s, 5xx and connection errors
+    are retried with jittered exponential backoff, and a Retry-After from the API
+    pauses every caller, not just the one that got it.
+    """
+
+    def __init__(
+        self,
+        client: groq.AsyncGroq,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_retries: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0
+    ):
+        self.client = client
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._turn = asyncio.Lock()
+        self._paused_until = 0.0
+
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.total_queue_wait = 0.0
+        self.max_queue_wait = 0.0
+
+    def _estimate(self, kwargs: dict) -> int:
+        prompt = sum(estimate_tokens(message) for message in kwargs.get("messages", []))
+        if kwargs.get("tools"):
+            prompt += len(json.dumps(kwargs["tools"])) // 4
+        return prompt + kwargs.get("max_tokens", 1024)
+
+    async def _wait_for_quota(self, cost: int):
+        """Block until this call fits in both quotas, callers are served first come first served"""
+        started = time.monotonic()
+        async with self._turn:
+            while True:
+                wait = max(
+                    self._paused_until - time.monotonic(),
+                    self.requests.wait_time(1),
+                    self.tokens.wait_time(cost)
+                )
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self.requests.take(1)
+            self.tokens.take(cost)
+
+        waited = time.monotonic() - started
+        self.attempts += 1
+        self.total_queue_wait += waited
+        self.max_queue_wait = max(self.max_queue_wait, waited)
+        metrics.observe("mcp_llm_queue_seconds", waited)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            # A little jitter so everyone that was told the same time doesn't come back together
+            return retry_after + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def create(self, deadline: Optional[float] = None, **kwargs) -> Any:
+        """
+        chat.completions.create with rate limiting and retries.
+
+        kwargs go to Groq unchanged. With a deadline (a time.monotonic() value)
+        each attempt gets the time that is left plus a small grace as its
+        timeout, so the caller's own deadline fires first, and no retry is
+        started that could not finish in time. A failure once the deadline has
+        passed is raised as asyncio.TimeoutError.
+        """
+        cost = self._estimate(kwargs)
+        attempt = 0
+        while True:
+            await self._wait_for_quota(cost)
+            if deadline is not None:
+                kwargs["timeout"] = max(0.0, deadline - time.monotonic()) + DEADLINE_GRACE
+            try:
+                response = await self.client.chat.completions.create(**kwargs)
+            except (groq.APIStatusError, groq.APIConnectionError) as e:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise asyncio.TimeoutError("Query deadline exceeded while waiting for Groq") from e
+                status = getattr(e, "status_code", None)
+                if status is not None and status not in RETRY_STATUSES:
+                    raise
+                delay = self._backoff(attempt, e)
+                if status == 429:
+                    self.rate_limited += 1
+                    metrics.inc("mcp_llm_rate_limited_total")
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                if attempt >= self.max_retries or (deadline is not None and time.monotonic() + delay >= deadline):
+                    raise
+                attempt += 1
+                self.retries += 1
+                reason = str(status) if status is not None else "connection"
+                metrics.inc("mcp_llm_retries_total", reason=reason)
+                print(f"Groq call failed ({reason}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            self.calls += 1
+            usage = getattr(response, "usage", None)
+            if usage is not None and usage.total_tokens:
+                self.tokens.give_back(cost - usage.total_tokens)
+            return response
+
+    def stats(self) -> dict:
+        """Call, retry and 429 counts plus how long calls waited for quota"""
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "avg_queue_wait_seconds": round(self.total_queue_wait / self.attempts, 4) if self.attempts else 0.0,
+            "max_queue_wait_seconds": round(self.max_queue_wait, 4),
+            "requests_per_minute": self.requests.per_minute,
+            "tokens_per_minute": self.tokens.per_minute
+        }
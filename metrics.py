@@ -0,0 +1,123 @@
+import bisect
+import os
+import time
+from contextlib import contextmanager, nullcontext
+
+# Seconds, covers a fast cached tool call up to a slow multi round query
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    "mcp_connect_seconds": "Time to spawn and initialize an MCP server",
+    "mcp_lazy_spawns_total": "Lazy servers spawned on demand",
+    "mcp_list_tools_seconds": "Time for a tools/list round trip",
+    "mcp_llm_completion_seconds": "Time for one Groq chat completion",
+    "mcp_llm_queue_seconds": "Time a Groq call waited for rate limit quota",
+    "mcp_llm_retries_total": "Groq calls retried, by reason",
+    "mcp_llm_rate_limited_total": "Groq calls answered with 429",
+    "mcp_tool_call_seconds": "Time for one tool call, including waiting for a server slot",
+    "mcp_result_encode_seconds": "Time to encode one tool result for the LLM",
+    "mcp_query_seconds": "Time for a whole query",
+    "mcp_queries_total": "Queries processed",
+    "mcp_tool_calls_total": "Tool calls made",
+}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple, extra: str = "") -> str:
+    parts = [f'{key}="{_escape(str(value))}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metrics:
+    """
+    Minimal counters, gauges and histograms rendered in the Prometheus text format.
+
+    When disabled every call returns straight away, so the instrumentation
+    left in the hot path costs next to nothing.
+    """
+
+    def __init__(self, enabled: bool = True, buckets: tuple = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._gauges: dict[str, dict[tuple, float]] = {}
+        self._histograms: dict[str, dict[tuple, list]] = {}
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """Increase a counter"""
+        if not self.enabled:
+            return
+        series = self._counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        """Set a gauge"""
+        if not self.enabled:
+            return
+        self._gauges.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, value: float, **labels):
+        """Record one histogram observation"""
+        if not self.enabled:
+            return
+        series = self._histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        entry = series.get(key)
+        if entry is None:
+            # Per bucket counts (last one is +Inf), sum, count
+            entry = series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def time(self, name: str, **labels):
+        """Context manager that observes how long its block took"""
+        if not self.enabled:
+            return nullcontext()
+        return self._timer(name, labels)
+
+    @contextmanager
+    def _timer(self, name: str, labels: dict):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def render(self) -> str:
+        """Everything recorded so far in the Prometheus text exposition format"""
+        lines = []
+
+        for kind, store in (("counter", self._counters), ("gauge", self._gauges)):
+            for name, series in sorted(store.items()):
+                if name in HELP:
+                    lines.append(f"# HELP {name} {HELP[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for name, series in sorted(self._histograms.items()):
+            if name in HELP:
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, (bucket_counts, total, count) in sorted(series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    bucket_labels = _format_labels(labels, f'le="{le}"')
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+
+# Shared by the client and the FastAPI app, set MCP_METRICS=0 to turn instrumentation off
+metrics = Metrics(enabled=os.environ.get("MCP_METRICS", "1") != "0")
@@ -1,7 +1,7 @@
 import React, {useState } from "react"
 import type {FormEvent} from "react";
-import api from "./api"
-import type { QueryRequest, QueryResponse } from "./api";
+import { streamQuery } from "./api"
+import type { QueryRequest, StreamEvent } from "./api";
 
 const App: React.FC = () => {
     const [query, setQuery] = useState<string>("");
@@ -14,9 +14,27 @@ const App: React.FC = () => {
         setResponse("");
         try{
 
-            const res = await api.post<QueryResponse>("/query", { query } as QueryRequest);
-
-            setResponse(res.data.response);
+            // Show tokens and tool activity as they stream in instead of waiting for the whole answer
+            await streamQuery({ query } as QueryRequest, (event: StreamEvent) => {
+                switch (event.type) {
+                    case "token":
+                        setResponse((prev) => prev + event.content);
+                        break;
+                    case "tool_call":
+                        setResponse((prev) => prev + `[Calling tool ${event.name} with args ${event.arguments}]\n`);
+                        break;
+                    case "tool_result":
+                        setResponse((prev) => prev + `[Tool ${event.name} ${event.is_error ? "failed" : "finished"}]\n`);
+                        break;
+                    case "final":
+                        // Cached answers arrive without tokens, the final text is the whole answer either way
+                        setResponse(event.response);
+                        break;
+                    case "error":
+                        setResponse((prev) => prev + "\nError: " + event.message);
+                        break;
+                }
+            });
         } 
         catch(error){
             setResponse("Error: " + (error as Error).message);
@@ -8,12 +8,51 @@ export interface QueryResponse {
     response: string;
 }
 
+export type StreamEvent =
+    | { type: "token"; content: string }
+    | { type: "tool_call"; id: string; name: string; arguments: string }
+    | { type: "tool_result"; id: string; name: string; is_error: boolean; content: string }
+    | { type: "final"; response: string; cached: boolean }
+    | { type: "error"; message: string };
+
+const BASE_URL = "http://localhost:8000";
 
 const api = axios.create({
-    baseURL: "http://localhost:8000",
+    baseURL: BASE_URL,
     headers: {
         "Content-Type": "application/json"
     },
 });
 
+// Reads the newline delimited JSON events from /query/stream as they arrive
+export async function streamQuery(request: QueryRequest, onEvent: (event: StreamEvent) => void): Promise<void> {
+    const res = await fetch(`${BASE_URL}/query/stream`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify(request),
+    });
+
+    if (!res.ok || !res.body) {
+        throw new Error(`Request failed with status ${res.status}`);
+    }
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split("\n");
+        buffer = lines.pop() ?? "";
+        for (const line of lines) {
+            if (line.trim()) onEvent(JSON.parse(line) as StreamEvent);
+        }
+    }
+
+    if (buffer.trim()) onEvent(JSON.parse(buffer) as StreamEvent);
+}
+
 export default api;
\ No newline at end of file
@@ -0,0 +1,202 @@
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Any, Optional
+
+import httpx
+
+
+def _http_date(value: Optional[str]) -> Optional[float]:
+    """Seconds since the epoch of an HTTP date header, None if missing or malformed"""
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _cache_control(value: Optional[str]) -> dict[str, Optional[str]]:
+    directives: dict[str, Optional[str]] = {}
+    for part in (value or "").split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') or None
+    return directives
+
+
+def freshness_lifetime(headers: httpx.Headers, heuristic_max: float) -> Optional[float]:
+    """
+    Seconds a response may be served without revalidation, None if it must not be stored.
+
+    max-age wins over Expires, both are reduced by the Age the response already
+    had upstream. Without either, 10% of the time since Last-Modified is used, up
+    to heuristic_max, like browsers do.
+    """
+    directives = _cache_control(headers.get("Cache-Control"))
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0.0
+
+    date = _http_date(headers.get("Date")) or time.time()
+    try:
+        age = float(headers.get("Age", 0))
+    except ValueError:
+        age = 0.0
+
+    for name in ("s-maxage", "max-age"):
+        if directives.get(name) is not None:
+            try:
+                return max(0.0, float(directives[name]) - age) #type: ignore
+            except ValueError:
+                return 0.0
+
+    if "Expires" in headers:
+        # A malformed Expires means already expired
+        expires = _http_date(headers["Expires"])
+        return max(0.0, expires - date - age) if expires is not None else 0.0
+
+    last_modified = _http_date(headers.get("Last-Modified"))
+    if last_modified is not None:
+        return min(heuristic_max, max(0.0, (date - last_modified) * 0.1))
+    return 0.0
+
+
+class CachedResponse:
+    """A cached NWS response body with what is needed to revalidate it"""
+
+    def __init__(self, data: Any, expires_at: float, etag: Optional[str], last_modified: Optional[str]):
+        self.data = data
+        self.expires_at = expires_at
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def fresh(self) -> bool:
+        return self.expires_at > time.time()
+
+    def conditional_headers(self) -> dict[str, str]:
+        """If-None-Match / If-Modified-Since so an unchanged resource comes back as a bodyless 304"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class NWSCache:
+    """
+    LRU cache of NWS API responses following their HTTP caching headers.
+
+    A fresh entry is returned without a request. A stale one that has an ETag or
+    Last-Modified is kept so it can be revalidated with a conditional request, a
+    304 then renews it without transferring the GeoJSON again. With a path the
+    entries are also written to a SQLite file and loaded again on startup, so a
+    restarted server starts warm.
+    """
+
+    def __init__(self, max_entries: int = 512, heuristic_max: float = 300.0, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.heuristic_max = heuristic_max
+
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.evictions = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._db = sqlite3.connect(path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS nws_responses "
+                "(url TEXT PRIMARY KEY, data TEXT, expires_at REAL, etag TEXT, last_modified TEXT, stored_at REAL)"
+            )
+            # Stale rows without validators can never be used again
+            self._db.execute(
+                "DELETE FROM nws_responses WHERE expires_at < ? AND etag IS NULL AND last_modified IS NULL",
+                (time.time(),)
+            )
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT url, data, expires_at, etag, last_modified FROM nws_responses ORDER BY stored_at DESC LIMIT ?",
+                (max_entries,)
+            ).fetchall()
+            # Oldest first so the most recently stored end up most recently used
+            for url, data, expires_at, etag, last_modified in reversed(rows):
+                self._entries[url] = CachedResponse(json.loads(data), expires_at, etag, last_modified)
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        """The entry for url, fresh or not, check .fresh before using it without a request"""
+        entry = self._entries.get(url)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(url)
+        if entry.fresh:
+            self.hits += 1
+        return entry
+
+    def put(self, url: str, response: httpx.Response, data: Any):
+        """Store a 200 response unless its headers forbid it or it could never be reused"""
+        lifetime = freshness_lifetime(response.headers, self.heuristic_max)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if lifetime is None or (lifetime <= 0 and not etag and not last_modified):
+            self._remove(url)
+            return
+
+        entry = CachedResponse(data, time.time() + lifetime, etag, last_modified)
+        self._entries[url] = entry
+        self._entries.move_to_end(url)
+        self._save(url, entry)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def renew(self, url: str, entry: CachedResponse, response: httpx.Response):
+        """A 304 for entry, take the new freshness and validators from it and keep the body"""
+        self.revalidated += 1
+        lifetime = freshness_lifetime(response.headers, self.heuristic_max)
+        if lifetime is None:
+            self._remove(url)
+            return
+        entry.expires_at = time.time() + lifetime
+        entry.etag = response.headers.get("ETag", entry.etag)
+        entry.last_modified = response.headers.get("Last-Modified", entry.last_modified)
+        if url in self._entries:
+            self._save(url, entry)
+
+    def _save(self, url: str, entry: CachedResponse):
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO nws_responses (url, data, expires_at, etag, last_modified, stored_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (url, json.dumps(entry.data), entry.expires_at, entry.etag, entry.last_modified, time.time())
+            )
+            self._db.commit()
+
+    def _remove(self, url: str):
+        self._entries.pop(url, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM nws_responses WHERE url = ?", (url,))
+            self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self) -> dict:
+        """Fresh hits, 304 revalidations, misses and evictions plus the current number of entries"""
+        return {
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries)
+        }
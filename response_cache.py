@@ -0,0 +1,112 @@
+import hashlib
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation so trivially different phrasings share an entry"""
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.rstrip("?!. ")
+
+
+class ResponseCache:
+    """
+    LRU cache of final query responses with a TTL.
+
+    Entries are keyed on the normalized query plus a fingerprint of the tool
+    catalog, so any change to the available tools misses the old answers. With a
+    path the entries are also written to a SQLite file and loaded again on
+    startup, so a warm cache survives restarts.
+    """
+
+    def __init__(self, ttl: float = 3600.0, max_entries: int = 1000, path: Optional[str] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._db = sqlite3.connect(path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT, expires_at REAL)"
+            )
+            self._db.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT key, response, expires_at FROM responses ORDER BY expires_at DESC LIMIT ?",
+                (max_entries,)
+            ).fetchall()
+            # Oldest first so the freshest entries end up most recently used
+            for key, response, expires_at in reversed(rows):
+                self._entries[key] = (expires_at, response)
+
+    @staticmethod
+    def _key(query: str, fingerprint: str) -> str:
+        return hashlib.sha256(f"{fingerprint}\n{normalize_query(query)}".encode()).hexdigest()
+
+    def get(self, query: str, fingerprint: str) -> Optional[str]:
+        """Return the cached response for the query, or None"""
+        key = self._key(query, fingerprint)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.time():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, query: str, fingerprint: str, response: str):
+        """Store a response, evicting the least recently used entries past max_entries"""
+        key = self._key(query, fingerprint)
+        expires_at = time.time() + self.ttl
+        self._entries[key] = (expires_at, response)
+        self._entries.move_to_end(key)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, expires_at) VALUES (?, ?, ?)",
+                (key, response, expires_at)
+            )
+            self._db.commit()
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
+
+    def clear(self):
+        """Drop every entry, in memory and on disk"""
+        self._entries.clear()
+        if self._db is not None:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self) -> dict:
+        """Hit, miss and eviction counts plus the current number of entries"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries)
+        }
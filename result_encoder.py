@@ -0,0 +1,63 @@
+import json
+from typing import Any
+
+import mcp.types as types
+
+
+def _compact_json(text: str) -> str:
+    """Re-serialize JSON text without whitespace, other text is returned unchanged"""
+    stripped = text.strip()
+    if not stripped or stripped[0] not in "{[":
+        return text
+    try:
+        return json.dumps(json.loads(stripped), separators=(",", ":"), ensure_ascii=False)
+    except ValueError:
+        return text
+
+
+def _encode_block(block: Any) -> str:
+    """Turn one content block of a tool result into the text the LLM needs"""
+    if isinstance(block, types.TextContent):
+        return _compact_json(block.text)
+    if isinstance(block, (types.ImageContent, types.AudioContent)):
+        # The model can't use raw base64 here, just say what came back
+        return f"[{block.type} {block.mimeType}, {len(block.data) * 3 // 4} bytes]"
+    if isinstance(block, types.EmbeddedResource):
+        resource = block.resource
+        if isinstance(resource, types.TextResourceContents):
+            return _compact_json(resource.text)
+        mime_type = f" {resource.mimeType}" if resource.mimeType else ""
+        return f"[binary resource {resource.uri}{mime_type}]"
+    if isinstance(block, types.ResourceLink):
+        return f"[resource {block.uri}]"
+    return str(block)
+
+
+def encode_result(result: Any, max_chars: int) -> str:
+    """
+    Encode a tool result as compact text for the tool message sent back to Groq.
+
+    Text blocks are passed through (JSON is minified), binary content is replaced
+    by a short description and structured content is used when there is no text.
+    Results longer than max_chars are cut off with a marker.
+    """
+    if isinstance(result, str):
+        text = result
+    elif isinstance(result, types.CallToolResult):
+        parts = [_encode_block(block) for block in result.content]
+        if not parts and result.structuredContent is not None:
+            parts.append(json.dumps(result.structuredContent, separators=(",", ":"), ensure_ascii=False))
+        text = "\n".join(parts)
+        if result.isError:
+            text = f"Error: {text}"
+    else:
+        text = str(result)
+
+    if len(text) > max_chars:
+        text = f"{text[:max_chars]}... [truncated {len(text) - max_chars} chars]"
+    return text
+
+
+def legacy_encoding(result: Any) -> str:
+    """The repr based encoding previously sent to Groq, used to measure savings"""
+    return str(result.content) if hasattr(result, "content") else str(result)
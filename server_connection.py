@@ -0,0 +1,250 @@
+import asyncio
+import importlib
+import importlib.util
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Optional
+
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.shared.memory import create_connected_server_and_client_session
+
+from broker_link import BrokerLink, RemoteSession
+
+
+class ServerConnection:
+    """
+    Owns the transport and ClientSession of a single MCP server.
+
+    The stdio transport and session are entered inside a dedicated task and kept
+    open until stop() is called, so several servers can be started concurrently
+    and shut down independently of each other.
+    """
+
+    def __init__(self, name: str, params: Optional[StdioServerParameters], message_handler=None):
+        self.name = name
+        self.params = params
+        self.message_handler = message_handler
+
+        self.session: Optional[ClientSession] = None
+        self.status = "stopped"
+        self.error: Optional[str] = None
+        self.startup_time: Optional[float] = None
+
+        self._task: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Future] = None
+        self._stop: Optional[asyncio.Event] = None
+
+    async def start(self, timeout: Optional[float] = None) -> ClientSession:
+        """Spawn the server and initialize its session, giving up after timeout seconds"""
+        ready = asyncio.get_running_loop().create_future()
+        self._ready = ready
+        self._stop = asyncio.Event()
+        self.status = "starting"
+        self.error = None
+
+        started = time.perf_counter()
+        self._task = asyncio.create_task(self._run(ready, self._stop), name=f"mcp-server-{self.name}")
+        try:
+            session = await asyncio.wait_for(asyncio.shield(ready), timeout)
+        except Exception as e:
+            self.startup_time = time.perf_counter() - started
+            await self.stop()
+            self.status = "unavailable"
+            self.error = f"timed out after {timeout}s" if isinstance(e, asyncio.TimeoutError) else str(e)
+            raise
+
+        self.startup_time = time.perf_counter() - started
+        return session
+
+    @asynccontextmanager
+    async def _open_session(self):
+        """Spawn the server over stdio and yield its initialized session"""
+        async with stdio_client(self.params) as (read, write):
+            async with ClientSession(read, write, message_handler=self.message_handler) as session:
+                await session.initialize()
+                yield session
+
+    async def _run(self, ready: asyncio.Future, stop: asyncio.Event):
+        """Hold the transport and session open until stop() is requested"""
+        try:
+            async with self._open_session() as session:
+                self.session = session
+                self.status = "ready"
+                ready.set_result(session)
+                await stop.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+        finally:
+            self.session = None
+
+    async def stop(self):
+        """Close the session and terminate the server process"""
+        if self._task is None or self._ready is None or self._stop is None:
+            return
+
+        self._stop.set()
+        if not self._ready.done():
+            # Still starting up, nothing to shut down gracefully
+            self._ready.cancel()
+            self._task.cancel()
+
+        try:
+            await self._task
+        except (asyncio.CancelledError, Exception):
+            pass
+
+        self._task = None
+        self.status = "stopped"
+
+
+class LazyServerConnection(ServerConnection):
+    """
+    A ServerConnection that only spawns its server when a tool call needs it.
+
+    Calls go through use(), which starts the server on first use (concurrent
+    callers share one start) and keeps it running while calls are in flight.
+    Once no call has used it for idle_timeout seconds the server is shut down
+    again and the connection goes back to "idle" until the next call.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        params: StdioServerParameters,
+        message_handler=None,
+        idle_timeout: Optional[float] = 300.0,
+        startup_timeout: Optional[float] = 30.0,
+        on_spawn: Optional[Callable[[ClientSession], None]] = None
+    ):
+        super().__init__(name, params, message_handler)
+        self.idle_timeout = idle_timeout
+        self.startup_timeout = startup_timeout
+        self.on_spawn = on_spawn
+        self.status = "idle"
+
+        self.active = 0
+        self.last_used = time.monotonic()
+        self.spawns = 0
+        self.idle_shutdowns = 0
+        self._lock = asyncio.Lock()
+        self._reaper: Optional[asyncio.Task] = None
+        # Set whenever no call is in flight, the reaper waits on it instead of polling
+        self._no_calls = asyncio.Event()
+        self._no_calls.set()
+
+    @asynccontextmanager
+    async def use(self):
+        """Yield a live session for one call, spawning the server first if it is idle"""
+        async with self._lock:
+            if self.status == "restarting":
+                raise RuntimeError(f"Server {self.name} is restarting")
+            if self.session is None:
+                await self.start(self.startup_timeout)
+                self.spawns += 1
+                if self.on_spawn is not None:
+                    self.on_spawn(self.session) #type: ignore
+            self.active += 1
+            self._no_calls.clear()
+            self.last_used = time.monotonic()
+            session = self.session
+        try:
+            yield session
+        finally:
+            self.active -= 1
+            self.last_used = time.monotonic()
+            if not self.active:
+                self._no_calls.set()
+
+    async def start(self, timeout: Optional[float] = None) -> ClientSession:
+        session = await super().start(timeout)
+        self.last_used = time.monotonic()
+        if self.idle_timeout is not None:
+            self._reaper = asyncio.create_task(self._reap_when_idle(), name=f"mcp-idle-{self.name}")
+        return session
+
+    async def _reap_when_idle(self):
+        """Shut the server down once it has gone idle_timeout seconds without a call"""
+        while True:
+            # The idle clock only starts once the last call is done
+            await self._no_calls.wait()
+            await asyncio.sleep(max(0.0, self.last_used + self.idle_timeout - time.monotonic()))
+            async with self._lock:
+                if self.active or time.monotonic() - self.last_used < self.idle_timeout:
+                    continue
+                self._reaper = None
+                self.status = "stopping"
+                await super().stop()
+                self.status = "idle"
+                self.idle_shutdowns += 1
+                print(f"Server {self.name} idle for {self.idle_timeout:g}s, shut down")
+                return
+
+    async def stop(self):
+        if self._reaper is not None and self._reaper is not asyncio.current_task():
+            self._reaper.cancel()
+        self._reaper = None
+        await super().stop()
+
+
+def load_server_object(module: Optional[str] = None, path: Optional[str] = None, attribute: str = "mcp") -> Any:
+    """Import a Python MCP server by module name or file path and return its FastMCP (or low level Server) object"""
+    if path:
+        module_name = os.path.splitext(os.path.basename(path))[0]
+        spec = importlib.util.spec_from_file_location(f"mcp_inprocess_{module_name}", path)
+        if spec is None or spec.loader is None:
+            raise ImportError(f"Cannot import server from {path}")
+        loaded = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(loaded)
+    elif module:
+        loaded = importlib.import_module(module)
+    else:
+        raise ValueError("An in-process server needs a module or a path")
+
+    server = getattr(loaded, attribute, None)
+    if server is None:
+        raise ImportError(f"{path or module} has no attribute {attribute}")
+    return server
+
+
+class InProcessServerConnection(ServerConnection):
+    """
+    Runs a Python MCP server inside this process, connected over in-memory streams.
+
+    Skips the subprocess, the pipes and the stdio framing, messages are still
+    passed through the MCP session so routing, timeouts and health checks work as
+    for any other server. The server shares the event loop, so a tool that blocks
+    blocks every query.
+    """
+
+    def __init__(self, name: str, server: Any, message_handler=None):
+        super().__init__(name, None, message_handler)
+        self.server = server
+
+    @asynccontextmanager
+    async def _open_session(self):
+        async with create_connected_server_and_client_session(self.server, message_handler=self.message_handler) as session:
+            yield session
+
+
+class BrokerServerConnection(ServerConnection):
+    """
+    A server owned by the shared MCP broker process, reached over a BrokerLink.
+
+    Opening the session only checks that the broker has the server up, so a
+    restart here reconnects to the broker instead of spawning anything.
+    """
+
+    def __init__(self, name: str, link: BrokerLink, message_handler=None):
+        super().__init__(name, None, message_handler)
+        self.link = link
+
+    @asynccontextmanager
+    async def _open_session(self):
+        await self.link.connect()
+        self.link.subscribe(self.name, self.message_handler)
+        session = RemoteSession(self.link, self.name)
+        await session.send_ping()
+        yield session
@@ -0,0 +1,110 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+from mcp import ClientSession
+
+from server_connection import ServerConnection
+
+# Lazy servers that are shut down, shutting down or being spawned on demand have nothing to ping
+NOT_RUNNING = ("idle", "stopping", "starting")
+
+
+class ServerSupervisor:
+    """
+    Keeps a set of ServerConnections healthy.
+
+    Every server is pinged periodically. A server whose ping fails or does not
+    answer within ping_timeout is considered dead or hung and is restarted with
+    exponential backoff. After a successful restart on_restart is awaited with the
+    new session so the owner can swap it into its routing table.
+    """
+
+    def __init__(
+        self,
+        connections: dict[str, ServerConnection],
+        on_restart: Callable[[str, ClientSession], Awaitable[None]],
+        interval: float = 15.0,
+        ping_timeout: float = 5.0,
+        startup_timeout: float = 30.0,
+        initial_backoff: float = 1.0,
+        max_backoff: float = 60.0
+    ):
+        self.connections = connections
+        self.on_restart = on_restart
+        self.interval = interval
+        self.ping_timeout = ping_timeout
+        self.startup_timeout = startup_timeout
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+
+        self.restart_counts: dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._restarting: dict[str, asyncio.Task] = {}
+
+    def start(self):
+        """Start the background health check loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch(), name="mcp-server-supervisor")
+
+    async def stop(self):
+        """Stop health checks and any restarts still in progress"""
+        tasks = list(self._restarting.values())
+        if self._task is not None:
+            tasks.append(self._task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._restarting.clear()
+
+    async def _watch(self):
+        """Ping all servers every interval seconds"""
+        while True:
+            await asyncio.sleep(self.interval)
+            await asyncio.gather(*[
+                self.check_server(name, connection)
+                for name, connection in list(self.connections.items())
+                if name not in self._restarting and connection.status not in NOT_RUNNING
+            ])
+
+    async def check_server(self, name: str, connection: ServerConnection) -> bool:
+        """Ping one server and schedule a restart if it is dead or hung"""
+        session = connection.session
+        healthy = False
+        if session is not None and connection.status == "ready":
+            try:
+                await asyncio.wait_for(session.send_ping(), self.ping_timeout)
+                healthy = True
+            except asyncio.TimeoutError:
+                print(f"Server {name} did not answer ping within {self.ping_timeout}s")
+            except Exception as e:
+                print(f"Server {name} failed health check: {str(e) or type(e).__name__}")
+
+        # A lazy server going idle mid ping is not a failure
+        if not healthy and name not in self._restarting and connection.status not in NOT_RUNNING:
+            connection.status = "restarting"
+            self._restarting[name] = asyncio.create_task(self._restart(name, connection), name=f"mcp-restart-{name}")
+        return healthy
+
+    async def _restart(self, name: str, connection: ServerConnection):
+        """Restart a server until it comes back, backing off between attempts"""
+        backoff = self.initial_backoff
+        try:
+            while True:
+                await connection.stop()
+                connection.status = "restarting"
+                try:
+                    session = await connection.start(self.startup_timeout)
+                except Exception as e:
+                    print(f"Restart of server {name} failed: {connection.error or str(e)}, retrying in {backoff:.0f}s")
+                    connection.status = "restarting"
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+                    continue
+
+                self.restart_counts[name] = self.restart_counts.get(name, 0) + 1
+                print(f"Server {name} restarted in {connection.startup_time:.2f}s")
+                await self.on_restart(name, session)
+                return
+        finally:
+            self._restarting.pop(name, None)
@@ -0,0 +1,111 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+import mcp.types as types
+
+
+class ToolResultCache:
+    """
+    LRU cache of tool results keyed by server, tool and arguments.
+
+    Caching is opt-in per tool: configure() takes a server's cacheTools mapping
+    from mcp.json, tool name (or "*" for every tool of that server) to a TTL in
+    seconds, null meaning the result never expires. Error results are never
+    cached. Least recently used entries are evicted once the cached results take
+    more than max_bytes.
+    """
+
+    def __init__(self, max_bytes: int = 10_000_000):
+        self.max_bytes = max_bytes
+        self.ttls: dict[str, dict[str, Optional[float]]] = {}
+
+        self._entries: OrderedDict[tuple, tuple[Optional[float], int, types.CallToolResult]] = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, server_name: str, tool_ttls: dict[str, Optional[float]]):
+        """Set which tools of a server are cacheable and for how long"""
+        self.ttls[server_name] = dict(tool_ttls)
+
+    def is_cacheable(self, server_name: str, tool_name: str) -> bool:
+        """Check whether results of this tool may be cached"""
+        tool_ttls = self.ttls.get(server_name, {})
+        return tool_name in tool_ttls or "*" in tool_ttls
+
+    def _ttl(self, server_name: str, tool_name: str) -> Optional[float]:
+        tool_ttls = self.ttls[server_name]
+        return tool_ttls[tool_name] if tool_name in tool_ttls else tool_ttls["*"]
+
+    @staticmethod
+    def _key(server_name: str, tool_name: str, arguments: dict[str, Any]) -> tuple:
+        return (server_name, tool_name, json.dumps(arguments, sort_keys=True, default=str))
+
+    def get(self, server_name: str, tool_name: str, arguments: dict[str, Any]) -> Optional[types.CallToolResult]:
+        """Return a cached result, or None if there is no fresh entry"""
+        if not self.is_cacheable(server_name, tool_name):
+            return None
+
+        key = self._key(server_name, tool_name, arguments)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, size, result = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, server_name: str, tool_name: str, arguments: dict[str, Any], result: types.CallToolResult):
+        """Store a successful result if the tool is cacheable"""
+        if not self.is_cacheable(server_name, tool_name) or result.isError:
+            return
+
+        size = len(result.model_dump_json())
+        if size > self.max_bytes:
+            return
+
+        key = self._key(server_name, tool_name, arguments)
+        if key in self._entries:
+            self._remove(key)
+
+        ttl = self._ttl(server_name, tool_name)
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._entries[key] = (expires_at, size, result)
+        self._bytes += size
+
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, server_name: Optional[str] = None):
+        """Drop cached results for one server, or everything"""
+        for key in list(self._entries):
+            if server_name is None or key[0] == server_name:
+                self._remove(key)
+
+    def _remove(self, key: tuple):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes
+        }
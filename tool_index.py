@@ -0,0 +1,90 @@
+import math
+import re
+from collections import Counter
+from typing import Optional
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "for", "from", "get", "give",
+    "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "please", "the", "this", "to",
+    "what", "whats", "when", "which", "with", "you", "your"
+}
+
+
+def tokenize(text: str) -> list[str]:
+    """Split text into lowercase terms, breaking up snake_case and camelCase and stripping common suffixes"""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text)
+    terms = []
+    for word in re.split(r"[^A-Za-z0-9]+", text.lower()):
+        if not word or word in STOPWORDS:
+            continue
+        for suffix in ("ing", "ed", "es", "s"):
+            if len(word) > len(suffix) + 2 and word.endswith(suffix):
+                word = word[:-len(suffix)]
+                break
+        terms.append(word)
+    return terms
+
+
+def tool_document(tool: dict) -> str:
+    """Text that describes a Groq tool definition: its name, description and parameter names and descriptions"""
+    function = tool["function"]
+    parts = [function["name"], function.get("description") or ""]
+    for name, schema in (function.get("parameters") or {}).get("properties", {}).items():
+        parts.append(name)
+        if isinstance(schema, dict):
+            parts.append(schema.get("description") or "")
+    return " ".join(parts)
+
+
+class ToolIndex:
+    """
+    BM25 index over a tool catalog, built once whenever the catalog is loaded.
+
+    select() returns the top_k tools most relevant to a query. When nothing in
+    the catalog matches the query well enough the full tool list is returned, so
+    the LLM is never left without the tool it needs.
+    """
+
+    def __init__(self, tools: list[dict], k1: float = 1.5, b: float = 0.75):
+        self.tools = tools
+        self.k1 = k1
+        self.b = b
+
+        self.doc_terms = [Counter(tokenize(tool_document(tool))) for tool in tools]
+        self.doc_lengths = [sum(terms.values()) for terms in self.doc_terms]
+        self.avg_length = sum(self.doc_lengths) / len(tools) if tools else 0.0
+
+        doc_freq = Counter(term for terms in self.doc_terms for term in terms)
+        count = len(tools)
+        self.idf = {
+            term: math.log(1 + (count - freq + 0.5) / (freq + 0.5))
+            for term, freq in doc_freq.items()
+        }
+
+    def scores(self, query: str) -> list[float]:
+        """BM25 score of every tool against the query"""
+        query_terms = set(tokenize(query))
+        scores = []
+        for terms, length in zip(self.doc_terms, self.doc_lengths):
+            score = 0.0
+            for term in query_terms:
+                freq = terms.get(term)
+                if not freq:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * length / self.avg_length)
+                score += self.idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            scores.append(score)
+        return scores
+
+    def select(self, query: str, top_k: Optional[int], min_score: float = 0.5) -> tuple[list[dict], bool]:
+        """Pick the tools relevant to the query, returns the tools and whether it fell back to the full set"""
+        if top_k is None or len(self.tools) <= top_k:
+            return self.tools, False
+
+        ranked = sorted(zip(self.scores(query), range(len(self.tools))), reverse=True)
+        selected = [index for score, index in ranked[:top_k] if score >= min_score]
+        if not selected:
+            return self.tools, True
+
+        # Keep catalog order so the prompt is stable between similar queries
+        return [self.tools[index] for index in sorted(selected)], False
@@ -0,0 +1,57 @@
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+
+import mcp.types as types
+from mcp import StdioServerParameters
+
+
+def server_key(params: StdioServerParameters) -> str:
+    """Fingerprint of how a server is launched, a changed command or args makes its snapshot unusable"""
+    launch = {"command": params.command, "args": params.args, "env": params.env}
+    return hashlib.sha256(json.dumps(launch, sort_keys=True).encode()).hexdigest()
+
+
+class ToolSnapshot:
+    """
+    On-disk copy of every server's tool list.
+
+    Lets lazy servers offer their tools to the LLM at startup without being
+    spawned. Entries are keyed on the server name and checked against the launch
+    fingerprint, and the file is rewritten atomically whenever a server's tools
+    are loaded.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._servers: dict[str, dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self._servers = json.load(f).get("servers", {})
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable tool snapshot {path}: {str(e)}")
+
+    def get(self, server_name: str, key: str) -> Optional[tuple[list[types.Tool], float]]:
+        """The saved tools of a server and when they were saved, or None if missing or out of date"""
+        entry = self._servers.get(server_name)
+        if entry is None or entry.get("key") != key:
+            return None
+        try:
+            tools = [types.Tool.model_validate(tool) for tool in entry["tools"]]
+        except (KeyError, ValueError):
+            return None
+        return tools, entry.get("saved_at", 0.0)
+
+    def put(self, server_name: str, key: str, tools: list[types.Tool]):
+        self._servers[server_name] = {
+            "key": key,
+            "saved_at": time.time(),
+            "tools": [tool.model_dump(mode="json", exclude_none=True) for tool in tools]
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"servers": self._servers}, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,169 @@
+import json
+import os
+import secrets
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Optional
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+current_request_id: ContextVar[Optional[str]] = ContextVar("current_request_id", default=None)
+
+
+def new_request_id() -> str:
+    return secrets.token_hex(8)
+
+
+def _otlp_value(value: Any) -> dict:
+    """Wrap a python value in an OTLP AnyValue"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """One timed operation in a trace"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: int, attributes: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.status = STATUS_OK
+        self.status_message = ""
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_error(self, message: str):
+        self.status = STATUS_ERROR
+        self.status_message = message
+
+    def traceparent(self) -> str:
+        """W3C traceparent header value pointing at this span"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": self.status, "message": self.status_message}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class Tracer:
+    """
+    Records span trees and appends them to a local file as OTLP JSON lines.
+
+    Each line is an ExportTraceServiceRequest holding the spans of one trace,
+    written when its root span ends, so the file can be read offline or replayed
+    into any OTLP collector later. Without a path tracing is off and span()
+    costs next to nothing.
+    """
+
+    def __init__(self, path: Optional[str], service_name: str = "mcp-client"):
+        self.path = path
+        self.service_name = service_name
+        self._pending: dict[str, list[Span]] = {}
+        self._open_traces: set[str] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def span(self, name: str, kind: int = KIND_INTERNAL, **attributes):
+        """Context manager that opens a child of the current span, yielding the span or None if tracing is off"""
+        if not self.enabled:
+            return nullcontext()
+        return self._span(name, kind, attributes)
+
+    @contextmanager
+    def _span(self, name: str, kind: int, attributes: dict):
+        parent = current_span.get()
+        trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        request_id = current_request_id.get()
+        if request_id and parent is None:
+            attributes["request.id"] = request_id
+
+        span = Span(name, trace_id, parent.span_id if parent else None, kind, attributes)
+        if parent is None:
+            self._open_traces.add(trace_id)
+        token = current_span.set(span)
+        try:
+            yield span
+        except GeneratorExit:
+            span.set_error("cancelled")
+            raise
+        except BaseException as e:
+            span.set_error(f"{type(e).__name__}: {str(e)}")
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            try:
+                current_span.reset(token)
+            except ValueError:
+                # Closed from another context, e.g. an abandoned async generator
+                pass
+            self._finish(span)
+
+    def _finish(self, span: Span):
+        """Buffer a finished span and write out the trace once its root span is done"""
+        self._pending.setdefault(span.trace_id, []).append(span)
+        if span.parent_id is None:
+            self._open_traces.discard(span.trace_id)
+            self._write(self._pending.pop(span.trace_id))
+        elif span.trace_id not in self._open_traces:
+            # Root already written (e.g. a task outliving its query), flush the straggler on its own
+            self._write(self._pending.pop(span.trace_id))
+
+    def _write(self, spans: list[Span]):
+        request = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{
+                    "scope": {"name": self.service_name},
+                    "spans": [span.to_otlp() for span in spans]
+                }]
+            }]
+        }
+        with open(self.path, "a", encoding="utf-8") as f: #type: ignore
+            f.write(json.dumps(request) + "\n")
+
+    def propagation_meta(self) -> Optional[dict]:
+        """Request metadata to attach to outgoing MCP calls: the request id and W3C traceparent"""
+        meta = {}
+        request_id = current_request_id.get()
+        if request_id:
+            meta["request_id"] = request_id
+        span = current_span.get()
+        if span is not None:
+            meta["traceparent"] = span.traceparent()
+        return meta or None
+
+
+# Shared by the client and the FastAPI app, set TRACE_FILE to a path to turn tracing on
+tracer = Tracer(os.environ.get("TRACE_FILE"))
@@ -1,31 +1,154 @@
-from typing import Any
+from typing import Any, AsyncIterator
+from contextlib import asynccontextmanager
+import asyncio
+import importlib.util
+import json
+import os
+import sys
 import httpx
 from mcp.server.fastmcp import FastMCP
+from pydantic import BaseModel
 
-#init fastmcp server
-mcp = FastMCP("weather")
+from nws_cache import NWSCache, CachedResponse
+from gridpoint_index import GridpointIndex, round_coordinates
 
 #constants
-NWS_API_BASE = "https://api.weather.gov"
+NWS_API_BASE = os.environ.get("NWS_API_BASE", "https://api.weather.gov")
 USER_AGENT = "weather-app/1.0"
-client = httpx.AsyncClient()
 
-async def make_nws_request(url: str) -> dict[str, Any] | None:
+# Connection pool and timeouts of the NWS client, one pool is shared by every tool call
+NWS_TIMEOUT = float(os.environ.get("NWS_TIMEOUT", 30))
+NWS_CONNECT_TIMEOUT = float(os.environ.get("NWS_CONNECT_TIMEOUT", 10))
+NWS_MAX_CONNECTIONS = int(os.environ.get("NWS_MAX_CONNECTIONS", 20))
+NWS_MAX_KEEPALIVE = int(os.environ.get("NWS_MAX_KEEPALIVE", 10))
+NWS_KEEPALIVE_EXPIRY = float(os.environ.get("NWS_KEEPALIVE_EXPIRY", 30))
+# HTTP/2 needs the h2 package (pip install httpx[http2])
+NWS_HTTP2 = os.environ.get("NWS_HTTP2", "").lower() in ("1", "true", "yes")
+
+# get_forecasts: NWS requests in flight per call and locations per call
+NWS_BATCH_CONCURRENCY = int(os.environ.get("NWS_BATCH_CONCURRENCY", 4))
+NWS_BATCH_MAX_LOCATIONS = int(os.environ.get("NWS_BATCH_MAX_LOCATIONS", 50))
+
+# Responses are reused as their Cache-Control/Expires allow and revalidated with ETag/Last-Modified,
+# set NWS_CACHE_PATH to keep them across restarts
+nws_cache = NWSCache(
+    max_entries=int(os.environ.get("NWS_CACHE_MAX_ENTRIES", 512)),
+    path=os.environ.get("NWS_CACHE_PATH")
+)
+
+# Coordinates to forecast URL, so get_forecast usually skips the /points round trip.
+# Points within NWS_GRIDPOINT_RADIUS_KM of a resolved one share its grid cell's forecast
+gridpoints = GridpointIndex(
+    path=os.environ.get("NWS_GRIDPOINT_PATH"),
+    radius_km=float(os.environ.get("NWS_GRIDPOINT_RADIUS_KM", 1.0))
+)
+
+# Single flight: concurrent requests for the same URL wait on one fetch
+_in_flight: dict[str, asyncio.Task] = {}
+request_stats = {"upstream": 0, "coalesced": 0}
+
+
+class NWSError(Exception):
+    """A request to the NWS API failed, the message says how"""
+
+    def __init__(self, message: str, status: int | None = None):
+        super().__init__(message)
+        self.status = status
+
+
+def create_nws_client() -> httpx.AsyncClient:
+    http2 = NWS_HTTP2
+    if http2 and importlib.util.find_spec("h2") is None:
+        # stdout is the MCP transport, say it on stderr
+        print("NWS_HTTP2 is set but the h2 package is not installed, using HTTP/1.1", file=sys.stderr)
+        http2 = False
+    return httpx.AsyncClient(
+        headers={
+            "User-Agent": USER_AGENT,
+            "Accept":"application/geo+json"
+        },
+        timeout=httpx.Timeout(NWS_TIMEOUT, connect=NWS_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=NWS_MAX_CONNECTIONS,
+            max_keepalive_connections=NWS_MAX_KEEPALIVE,
+            keepalive_expiry=NWS_KEEPALIVE_EXPIRY
+        ),
+        http2=http2
+    )
+
+# Opened by the server lifespan, or on first use when the tools are called without it
+client: httpx.AsyncClient | None = None
+
+def get_client() -> httpx.AsyncClient:
+    global client
+    if client is None or client.is_closed:
+        client = create_nws_client()
+    return client
+
+@asynccontextmanager
+async def lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """Keep one pooled NWS client open for as long as the server runs"""
+    global client
+    client = create_nws_client()
+    try:
+        yield
+    finally:
+        await client.aclose()
+        client = None
+        nws_cache.close()
+
+#init fastmcp server
+mcp = FastMCP("weather", lifespan=lifespan)
+
+async def make_nws_request(url: str) -> dict[str, Any]:
     """
     Make a request to the NWS API and return the response as a dictionary.
+    Raises NWSError saying whether it timed out, was refused or could not connect.
+    Concurrent calls for the same URL share one upstream request and its result.
     """
-    headers = {
-        "User-Agent": USER_AGENT,
-        "Accept":"application/geo+json"
-    }
+    cached = nws_cache.get(url)
+    if cached is not None and cached.fresh:
+        return cached.data
 
-    async with client:
-        try:
-            response = await client.get(url, headers=headers, timeout=30.0)
-            response.raise_for_status()
-            return response.json()
-        except Exception:
-            return None
+    fetch = _in_flight.get(url)
+    if fetch is not None:
+        request_stats["coalesced"] += 1
+    else:
+        request_stats["upstream"] += 1
+        fetch = asyncio.create_task(_fetch_nws(url, cached))
+        _in_flight[url] = fetch
+        fetch.add_done_callback(lambda done: _fetch_done(url, done))
+    # Shielded so a caller that gives up does not cancel the fetch for the others
+    return await asyncio.shield(fetch)
+
+def _fetch_done(url: str, fetch: asyncio.Task):
+    if _in_flight.get(url) is fetch:
+        del _in_flight[url]
+    # Everyone waiting may have been cancelled, do not leave the error unretrieved
+    if not fetch.cancelled():
+        fetch.exception()
+
+async def _fetch_nws(url: str, cached: CachedResponse | None) -> dict[str, Any]:
+    """The upstream request of make_nws_request, conditional if a stale copy is cached"""
+    try:
+        response = await get_client().get(url, headers=cached.conditional_headers() if cached is not None else None)
+        if response.status_code == 304 and cached is not None:
+            nws_cache.renew(url, cached, response)
+            return cached.data
+        response.raise_for_status()
+        data = response.json()
+        nws_cache.put(url, response, data)
+        return data
+    except httpx.TimeoutException as e:
+        raise NWSError(f"NWS API timed out ({type(e).__name__}) for {url}") from e
+    except httpx.HTTPStatusError as e:
+        status = e.response.status_code
+        kind = "rejected the request" if status < 500 else "failed"
+        raise NWSError(f"NWS API {kind} with {status} {e.response.reason_phrase} for {url}", status) from e
+    except httpx.RequestError as e:
+        raise NWSError(f"Could not reach the NWS API ({type(e).__name__}: {str(e)}) for {url}") from e
+    except ValueError as e:
+        raise NWSError(f"NWS API returned invalid JSON for {url}") from e
 
 def format_alert(feature: dict) -> str:
     """
@@ -46,9 +169,10 @@ async def get_alerts(state: str) -> str:
     Get weather alerts for a given state.
     """
     url = f"{NWS_API_BASE}/alerts/active/area/{state}"
+    # An NWSError becomes an error result, so the failure is not cached as if it were an answer
     data = await make_nws_request(url)
     
-    if not data or "features" not in data:
+    if "features" not in data:
         return "Unable to fetch alerts or no alerts found. Please try again later."
     
     if not data["features"]:
@@ -57,23 +181,39 @@ async def get_alerts(state: str) -> str:
     alerts = [format_alert(feature) for feature in data["features"]]
     return "\n --- \n".join(alerts)
 
-@mcp.tool()
-async def get_forecast(lat: float, lon: float) -> str:
+async def resolve_forecast_url(lat: float, lon: float, use_index: bool = True) -> tuple[str, bool]:
     """
-    Get the weather forecast for a given latitude and longitude.
+    The forecast URL of the grid cell holding the coordinates, and whether it came from the index.
     """
-    url = f"{NWS_API_BASE}/points/{lat},{lon}"
-    data = await make_nws_request(url)
-    
-    if not data:
-        return "Unable to fetch forecast data for this location. Please try again later."
+    if use_index:
+        forecast_url = gridpoints.lookup(lat, lon)
+        if forecast_url is not None:
+            return forecast_url, True
 
-    forecast_url = data["properties"]["forecast"] 
-    forecast_data = await make_nws_request(forecast_url)
+    # More than 4 decimals gets a redirect from /points
+    lat, lon = round_coordinates(lat, lon)
+    data = await make_nws_request(f"{NWS_API_BASE}/points/{lat},{lon}")
+    gridpoints.store(lat, lon, data["properties"])
+    return data["properties"]["forecast"], False
 
-    if not forecast_data:
-        return "Unable to fetch forecast data for this location. Please try again later."
-    
+async def fetch_forecast(lat: float, lon: float, forecast_url: str, from_index: bool) -> dict[str, Any]:
+    """
+    Fetch the forecast of a resolved point, resolving it again if the indexed URL is gone.
+    """
+    try:
+        return await make_nws_request(forecast_url)
+    except NWSError as e:
+        if not from_index or e.status != 404:
+            raise
+        # The NWS moved the grid since it was indexed, resolve the point again
+        gridpoints.forget(forecast_url)
+        forecast_url, _ = await resolve_forecast_url(lat, lon, use_index=False)
+        return await make_nws_request(forecast_url)
+
+def format_forecast(forecast_data: dict) -> str:
+    """
+    Format the first periods of a forecast into a string.
+    """
     periods = forecast_data["properties"]["periods"]
     forecasts = []
 
@@ -88,5 +228,71 @@ async def get_forecast(lat: float, lon: float) -> str:
 
     return "\n --- \n".join(forecasts)
 
+@mcp.tool()
+async def get_forecast(lat: float, lon: float) -> str:
+    """
+    Get the weather forecast for a given latitude and longitude.
+    """
+    forecast_url, from_index = await resolve_forecast_url(lat, lon)
+    forecast_data = await fetch_forecast(lat, lon, forecast_url, from_index)
+    return format_forecast(forecast_data)
+
+class Location(BaseModel):
+    lat: float
+    lon: float
+
+@mcp.tool()
+async def get_forecasts(locations: list[Location]) -> str:
+    """
+    Get the weather forecasts for several latitude and longitude pairs at once.
+    Use this instead of calling get_forecast for each location.
+    """
+    if not locations:
+        return "No locations given."
+    if len(locations) > NWS_BATCH_MAX_LOCATIONS:
+        raise ValueError(f"At most {NWS_BATCH_MAX_LOCATIONS} locations per call, got {len(locations)}")
+
+    # Bounds NWS requests of this call, locations in the same grid cell share one forecast request
+    semaphore = asyncio.Semaphore(NWS_BATCH_CONCURRENCY)
+    fetches: dict[str, asyncio.Task] = {}
+
+    async def fetch_bounded(lat: float, lon: float, forecast_url: str, from_index: bool) -> dict[str, Any]:
+        async with semaphore:
+            return await fetch_forecast(lat, lon, forecast_url, from_index)
+
+    async def forecast_for(lat: float, lon: float) -> str:
+        async with semaphore:
+            forecast_url, from_index = await resolve_forecast_url(lat, lon)
+        if forecast_url not in fetches:
+            fetches[forecast_url] = asyncio.create_task(fetch_bounded(lat, lon, forecast_url, from_index))
+        return format_forecast(await fetches[forecast_url])
+
+    points = list(dict.fromkeys(round_coordinates(location.lat, location.lon) for location in locations))
+    results = dict(zip(points, await asyncio.gather(*(forecast_for(lat, lon) for lat, lon in points), return_exceptions=True)))
+
+    failures = [result for result in results.values() if isinstance(result, BaseException)]
+    if len(failures) == len(results):
+        # Nothing to report but errors, fail the call so it is not cached as an answer
+        raise failures[0]
+
+    sections = []
+    for location in locations:
+        result = results[round_coordinates(location.lat, location.lon)]
+        if isinstance(result, BaseException):
+            result = f"Unable to fetch forecast: {str(result) or type(result).__name__}"
+        sections.append(f"Location {location.lat},{location.lon}:\n{result}")
+    return "\n\n === \n\n".join(sections)
+
+@mcp.resource("stats://nws")
+def nws_stats() -> str:
+    """
+    Upstream NWS requests made and saved by coalescing, cache and gridpoint index counters.
+    """
+    return json.dumps({
+        "requests": request_stats,
+        "cache": nws_cache.stats(),
+        "gridpoints": gridpoints.stats()
+    })
+
 if __name__ == "__main__":
     mcp.run(transport='stdio')
\ No newline at end of file